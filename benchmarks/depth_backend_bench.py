@@ -0,0 +1,102 @@
+# Depth backends side by side on recorded footage: latency, and depth error
+# against a reference backend (monodepth2 by default). Monocular depth is
+# only defined up to scale, so each prediction is median-scaled to the
+# reference before abs-rel and delta < 1.25 are computed.
+#   python benchmarks/depth_backend_bench.py clip.mp4
+#   python benchmarks/depth_backend_bench.py frames/ --threads 4
+#   python benchmarks/depth_backend_bench.py frames/ --quantize models/monodepth2_fp32.onnx
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.depth_backends import (BACKENDS, ONNX_MODEL, create_depth_backend, disp_to_depth,
+                                   quantize_model)
+from vision.face_detectors import MODEL_DIR
+from vision.frame_source import open_source
+
+
+def depth_error(pred, ref):
+    if pred.shape != ref.shape:
+        pred = cv2.resize(pred, (ref.shape[1], ref.shape[0]), interpolation=cv2.INTER_LINEAR)
+    valid = ref > 0
+    # abs-rel and delta are defined on depth, not disparity
+    pred, ref = disp_to_depth(pred[valid]), disp_to_depth(ref[valid])
+    pred = pred * (np.median(ref) / max(np.median(pred), 1e-6))
+    pred = np.maximum(pred, 1e-6)
+    abs_rel = float(np.mean(np.abs(pred - ref) / ref))
+    delta = float(np.mean(np.maximum(pred / ref, ref / pred) < 1.25))
+    return abs_rel, delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', help='video file, image directory or camera index')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--size', default='640x192', help='input size handed to every backend')
+    parser.add_argument('--backends', nargs='+', default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument('--reference', default='monodepth2', help='backend the error is measured against')
+    parser.add_argument('--onnx-model', default=os.path.join(MODEL_DIR, ONNX_MODEL))
+    parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime intra-op threads')
+    parser.add_argument('--quantize', metavar='FP32_ONNX',
+                        help='first quantize this fp32 export to --onnx-model, calibrated on the frames')
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.split('x'))
+
+    source = open_source(args.source, realtime=False)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+    source.release()
+    if not frames:
+        print(f"Error: No frames read from {args.source}")
+        sys.exit(1)
+
+    if args.quantize:
+        start = time.perf_counter()
+        quantize_model(args.quantize, args.onnx_model, frames[:min(len(frames), 32)])
+        print(f"Quantized {args.quantize} -> {args.onnx_model} in {time.perf_counter() - start:.1f}s")
+
+    backends = {}
+    # Reference first, so every other backend can be compared against it
+    for name in sorted(args.backends, key=lambda n: n != args.reference):
+        kwargs = {'model': args.onnx_model, 'threads': args.threads} if name == 'onnx' else {}
+        try:
+            backends[name] = create_depth_backend(name, **kwargs)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"Skipping {name}: {e}")
+
+    outputs = {}
+    print(f"{len(frames)} frames at {size[0]}x{size[1]}")
+    print(f"{'backend':<11} {'fps':>8} {'p50 ms':>8} {'p95 ms':>8} {'abs_rel':>8} {'d<1.25':>8}")
+    for name, backend in backends.items():
+        backend.eval(frames[0])  # warm up
+        times = []
+        outputs[name] = []
+        for frame in frames:
+            start = time.perf_counter()
+            depth = backend.eval(frame)
+            times.append(time.perf_counter() - start)
+            outputs[name].append(np.array(depth, np.float32).squeeze())
+        times.sort()
+        fps = len(times) / sum(times)
+        p50 = times[len(times) // 2] * 1000
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))] * 1000
+        if args.reference in outputs and name != args.reference:
+            errors = [depth_error(p, r) for p, r in zip(outputs[name], outputs[args.reference])]
+            abs_rel = f"{np.mean([e[0] for e in errors]):.4f}"
+            delta = f"{np.mean([e[1] for e in errors]):.4f}"
+        else:
+            abs_rel = delta = '-'
+        print(f"{name:<11} {fps:>8.1f} {p50:>8.2f} {p95:>8.2f} {abs_rel:>8} {delta:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Face detector backends on recorded footage: frames per second, latency
+# and recall. Ground truth comes from a CSV of frame,x,y,w,h rows if given,
+# otherwise from a reference backend (recall is then relative to it).
+#   python benchmarks/face_detector_bench.py clip.mp4 --width 640
+#   python benchmarks/face_detector_bench.py frames/ --annotations faces.csv
+import argparse
+import collections
+import csv
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.face_detectors import BACKENDS, create_detector
+from vision.face_tracking import box_iou
+from vision.frame_source import open_source
+
+
+def load_annotations(path, scale):
+    truth = collections.defaultdict(list)
+    with open(path) as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip().isdigit():
+                continue
+            frame, x, y, w, h = (int(float(v)) for v in row[:5])
+            truth[frame].append(tuple(int(v * scale) for v in (x, y, w, h)))
+    return truth
+
+
+def recall(found, truth):
+    hits = 0
+    for box in truth:
+        if any(box_iou(box, other) >= 0.5 for other in found):
+            hits += 1
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', help='video file, image directory or camera index')
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--width', type=int, default=640, help='detection width; frames are resized to it')
+    parser.add_argument('--detectors', nargs='+', default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument('--annotations', help='CSV of frame,x,y,w,h at source resolution')
+    parser.add_argument('--reference', default='yunet', help='backend used as ground truth without annotations')
+    args = parser.parse_args()
+
+    source = open_source(args.source, realtime=False)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame.copy())
+    source.release()
+    if not frames:
+        print(f"Error: No frames read from {args.source}")
+        sys.exit(1)
+    scale = args.width / frames[0].shape[1]
+    frames = [cv2.resize(f, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) for f in frames]
+
+    detectors = {}
+    for name in args.detectors:
+        try:
+            detectors[name] = create_detector(name)
+        except (FileNotFoundError, cv2.error) as e:
+            print(f"Skipping {name}: {e}")
+
+    if args.annotations:
+        truth = load_annotations(args.annotations, scale)
+        truth_name = args.annotations
+    elif args.reference in detectors:
+        truth = {i: detectors[args.reference].detect(f) for i, f in enumerate(frames)}
+        truth_name = f"{args.reference} (reference)"
+    else:
+        truth = None
+        truth_name = None
+
+    print(f"{len(frames)} frames at {frames[0].shape[1]}x{frames[0].shape[0]}"
+          + (f", recall against {truth_name}" if truth is not None else ", no ground truth"))
+    print(f"{'detector':<8} {'fps':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall':>8} {'boxes':>8}")
+    for name, detector in detectors.items():
+        detector.detect(frames[0])  # warm up
+        times = []
+        hits = total = boxes = 0
+        for i, frame in enumerate(frames):
+            start = time.perf_counter()
+            found = detector.detect(frame)
+            times.append(time.perf_counter() - start)
+            boxes += len(found)
+            if truth is not None:
+                hits += recall(found, truth.get(i, []))
+                total += len(truth.get(i, []))
+        times.sort()
+        fps = len(times) / sum(times)
+        p50 = times[len(times) // 2] * 1000
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))] * 1000
+        rec = f"{hits / total:.3f}" if total else '-'
+        print(f"{name:<8} {fps:>8.1f} {p50:>8.2f} {p95:>8.2f} {rec:>8} {boxes:>8}")
+
+
+if __name__ == '__main__':
+    main()
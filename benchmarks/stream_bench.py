@@ -0,0 +1,84 @@
+# Compares MJPEG and H.264 streaming cost on recorded footage: bytes per
+# second on the wire and CPU seconds per frame for the encoder.
+#   python benchmarks/stream_bench.py clip.mp4 --frames 300 --bitrate 1000000
+import argparse
+import os
+import sys
+import time
+from fractions import Fraction
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.frame_source import open_source
+from vision.h264 import H264Broadcaster, av
+
+
+def load_frames(source, count):
+    frames = []
+    while len(frames) < count:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame.copy())
+    return frames
+
+
+def bench_mjpeg(frames, quality):
+    total = 0
+    cpu = time.process_time()
+    for frame in frames:
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        total += len(buffer)
+    return total, time.process_time() - cpu
+
+
+def bench_h264(frames, fps, bitrate, keyframe_interval):
+    encoder = H264Broadcaster(bitrate=bitrate, keyframe_interval=keyframe_interval, fps=fps)
+    container, stream, sink = encoder.open_encoder(frames[0].shape[1], frames[0].shape[0])
+    cpu = time.process_time()
+    for i, frame in enumerate(frames):
+        video_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        video_frame.pts = int(i * 1000 / fps)
+        video_frame.time_base = Fraction(1, 1000)
+        for packet in stream.encode(video_frame):
+            container.mux(packet)
+    for packet in stream.encode(None):
+        container.mux(packet)
+    container.close()
+    return len(sink.data), time.process_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', help='video file, image directory or camera index')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--fps', type=float, default=30.0, help='stream frame rate for bytes/s')
+    parser.add_argument('--quality', type=int, default=85, help='MJPEG quality')
+    parser.add_argument('--bitrate', type=int, default=1000000)
+    parser.add_argument('--keyframe-interval', type=int, default=30)
+    args = parser.parse_args()
+
+    source = open_source(args.source, realtime=False)
+    frames = load_frames(source, args.frames)
+    source.release()
+    if not frames:
+        print(f"Error: No frames read from {args.source}")
+        sys.exit(1)
+    n = len(frames)
+    h, w = frames[0].shape[:2]
+    print(f"{n} frames at {w}x{h}, {args.fps:g} fps")
+    print(f"{'stream':<8} {'KB/s':>10} {'CPU ms/frame':>14} {'CPU % at fps':>14}")
+    results = [('mjpeg',) + bench_mjpeg(frames, args.quality)]
+    if av is None:
+        print("PyAV not installed; skipping H.264")
+    else:
+        results.append(('h264',) + bench_h264(frames, args.fps, args.bitrate, args.keyframe_interval))
+    for name, total, cpu in results:
+        kbps = total / n * args.fps / 1024
+        per_frame = cpu / n
+        print(f"{name:<8} {kbps:>10.1f} {per_frame * 1000:>14.2f} {per_frame * args.fps * 100:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
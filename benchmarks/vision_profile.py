@@ -0,0 +1,87 @@
+# Headless profile of the face, depth and ArUco pipelines against recorded
+# footage, no robot hardware needed:
+#   python benchmarks/vision_profile.py clip.mp4 --frames 300
+#   python benchmarks/vision_profile.py frames_dir/ --pipelines face aruco
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.face_detectors import create_detector
+from vision.frame_source import open_source
+from vision.tracing import Tracer
+
+
+def face_pipeline():
+    # The backend v3 would use; R2D2_FACE_DETECTOR selects it
+    detector = create_detector()
+
+    def run(frame):
+        # Same input and parameters as FaceThread in r2d2_control_v3
+        gray = cv2.cvtColor(cv2.resize(frame, (320, 180)), cv2.COLOR_BGR2GRAY)
+        return detector.detect(gray, min_size=(20, 20))
+    return run
+
+
+def depth_pipeline():
+    import monodepth2
+    md = monodepth2.monodepth2()
+
+    def run(frame):
+        return md.eval(cv2.resize(frame, (640, 192)))
+    return run
+
+
+def aruco_pipeline():
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    detector = cv2.aruco.ArucoDetector(dictionary, cv2.aruco.DetectorParameters())
+
+    def run(frame):
+        return detector.detectMarkers(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    return run
+
+
+PIPELINES = {
+    'face': face_pipeline,
+    'depth': depth_pipeline,
+    'aruco': aruco_pipeline,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', help='video file, image directory or camera index')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--pipelines', nargs='+', default=['face', 'aruco'], choices=sorted(PIPELINES))
+    parser.add_argument('--realtime', action='store_true', help='pace playback at the source frame rate')
+    args = parser.parse_args()
+
+    source = open_source(args.source, realtime=args.realtime)
+    if not source.isOpened():
+        print(f"Error: Could not open {args.source}")
+        sys.exit(1)
+    pipelines = {name: PIPELINES[name]() for name in args.pipelines}
+    tracer = Tracer(window=args.frames)
+    start = time.perf_counter()
+    for i in range(args.frames):
+        with tracer.stage('read', i):
+            ret, frame = source.read()
+        if not ret:
+            break
+        for name, run in pipelines.items():
+            with tracer.stage(name, i):
+                run(frame)
+    elapsed = time.perf_counter() - start
+    print(f"{args.frames} frames in {elapsed:.2f}s ({args.frames / elapsed:.1f} fps overall)")
+    print(f"{'stage':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max fps':>8}")
+    for name, s in tracer.snapshot().items():
+        max_fps = 1000.0 / s['p50_ms'] if s['p50_ms'] else float('inf')
+        print(f"{name:<8} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {max_fps:>8.1f}")
+    source.release()
+
+
+if __name__ == '__main__':
+    main()
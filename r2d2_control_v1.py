@@ -2,12 +2,13 @@ from gpiozero import Motor
 import evdev
 import time
 import cv2
-import numpy as np
-import os
 import threading
 from flask import Flask, Response, render_template_string, request
 import subprocess
 import random
+from vision.frame_source import open_source
+from vision.face_detectors import create_detector
+from vision.optical_flow import OpticalFlowTracker
 
 app = Flask(__name__)
 
@@ -17,14 +18,15 @@ SPEKTRUM_PRODUCT_ID = 0x572b
 DEAD_ZONE = 0.2  # 20% dead zone
 
 # Face Detection and Optical Flow Constants
-cascade_path = "/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml"
-if not os.path.isfile(cascade_path):
-    print(f"Error: Cascade file not found at {cascade_path}")
+# Haar cascade by default; R2D2_FACE_DETECTOR selects lbp, ssd or yunet
+try:
+    face_detector = create_detector()
+except (FileNotFoundError, ValueError) as e:
+    print(f"Error: {e}")
     exit()
 
-face_cascade = cv2.CascadeClassifier(cascade_path)
-
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
+# Live camera by default; R2D2_FRAME_SOURCE can point at a recorded clip
+camera = open_source()
 if not camera.isOpened():
     print("Error: Could not open camera.")
     exit()
@@ -44,13 +46,10 @@ movement_command = None
 movement_start_time = 0
 
 # Optical Flow Parameters
-feature_params = dict(maxCorners=100, qualityLevel=0.3, minDistance=7, blockSize=7)
-lk_params = dict(winSize=(15, 15), maxLevel=2, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
-color = np.random.randint(0, 255, (100, 3))
+# Up to 100 persistent tracks, topped up only in empty grid cells
+flow = OpticalFlowTracker(max_tracks=100)
 
 # Global variables
-prev_frame = None
-prev_points = None
 running = True
 audio_lock = threading.Lock()
 audio_process = None
@@ -163,7 +162,6 @@ def head_motor_control():
         time.sleep(0.01)
 
 def generate_frames():
-    global prev_frame, prev_points
     while running:
         ret, frame = camera.read()
         if not ret:
@@ -172,7 +170,7 @@ def generate_frames():
         frame = cv2.flip(frame, -1)  # Flip for upside-down camera
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        faces = face_detector.detect(gray)
         
         if len(faces) > 0:
             for (x, y, w, h) in faces:
@@ -182,28 +180,10 @@ def generate_frames():
                 cv2.drawMarker(frame, (x, y+h), (0, 255, 0), cv2.MARKER_CROSS, 10, 2)
                 cv2.drawMarker(frame, (x+w, y+h), (0, 255, 0), cv2.MARKER_CROSS, 10, 2)
             
-            prev_points = None
+            flow.reset()
         else:
-            if prev_frame is not None:
-                if prev_points is None:
-                    prev_points = cv2.goodFeaturesToTrack(prev_frame, mask=None, **feature_params)
-                
-                if prev_points is not None:
-                    next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_frame, gray, prev_points, None, **lk_params)
-                    
-                    if next_points is not None:
-                        good_new = next_points[status == 1]
-                        good_old = prev_points[status == 1]
-                        
-                        for i, (new, old) in enumerate(zip(good_new, good_old)):
-                            a, b = new.ravel()
-                            c, d = old.ravel()
-                            frame = cv2.line(frame, (int(a), int(b)), (int(c), int(d)), color[i].tolist(), 2)
-                            frame = cv2.circle(frame, (int(a), int(b)), 5, color[i].tolist(), -1)
-                    
-                    prev_points = good_new.reshape(-1, 1, 2)
-        
-        prev_frame = gray
+            flow.update(gray)
+            flow.draw(frame)
         
         cv2.putText(frame, f"Movement: {movement_command if movement_command else 'None'}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
         
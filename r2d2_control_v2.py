@@ -8,6 +8,7 @@ import threading
 from flask import Flask, Response, render_template_string, request
 import subprocess
 import random
+from vision.frame_source import open_source
 import RPi.GPIO as GPIO
 
 app = Flask(__name__)
@@ -25,7 +26,8 @@ if not os.path.isfile(cascade_path):
 
 face_cascade = cv2.CascadeClassifier(cascade_path)
 
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
+# Live camera by default; R2D2_FRAME_SOURCE can point at a recorded clip
+camera = open_source()
 if not camera.isOpened():
     print("Error: Could not open camera.")
     exit()
@@ -3,21 +3,52 @@ import time
 import cv2
 import numpy as np
 import threading
-from flask import Flask, Response, render_template_string, request
+from flask import Flask, Response, jsonify, render_template_string, request
 import subprocess
 import random
 import RPi.GPIO as GPIO
 import urllib.request
-import monodepth2
+from vision.capture import CaptureThread
+from vision.frame_source import open_source
+from vision.buffers import BufferPool
+from vision.tracing import tracer
+from vision.broadcast import MJPEGBroadcaster
+from vision import ws_video
+from vision.h264 import H264Broadcaster
+from vision.pyramid import FramePyramid
+from vision.overlay import OverlayCompositor
+from vision.depth_scheduler import DepthScheduler
+from vision.depth_overlay import DepthOverlayCache
+from vision.depth_backends import create_depth_backend
+from vision.obstacles import ObstacleSectors
+from vision.motion import MotionGate
+from vision.head_follow import HeadFollowController
+from vision.task_scheduler import VisionScheduler
+from vision.face_tracking import FaceTracker
+from vision.face_workers import AsyncDetector, FaceWorkerPool
 
 app = Flask(__name__)
 
-# Initialize Monodepth2
-md = monodepth2.monodepth2()
+# Face detection runs in worker processes fed through shared memory. They
+# are forked, so start them before Monodepth2 and any of our threads.
+# Haar cascade by default; R2D2_FACE_DETECTOR selects lbp, ssd or yunet.
+try:
+    face_pool = FaceWorkerPool(workers=2, max_shape=(180, 320))  # the 320x180 detect level
+except (FileNotFoundError, ValueError) as e:
+    print(f"Error: {e}")
+    exit()
+
+# Initialize Monodepth2; R2D2_DEPTH_BACKEND=onnx runs the int8 model through ONNX Runtime
+try:
+    md = create_depth_backend()
+except (ImportError, FileNotFoundError, ValueError) as e:
+    print(f"Error: {e}")
+    exit()
 
 # Shared cache for async depth and face detection
-last_depth_map = None
-last_depth_lock = threading.Lock()
+depth_overlay = DepthOverlayCache()
+# Nearest obstacle per steering sector, read by the motor loop for auto-braking
+obstacles = ObstacleSectors(depth_scale=float(os.environ.get('R2D2_DEPTH_SCALE', '1.0')))
 last_face_boxes = []
 last_face_lock = threading.Lock()
 
@@ -46,12 +77,33 @@ SERVO_POSITIONS = {
 current_servo_position = 'center'
 servo_lock = threading.Lock()
 
+def set_servo_angle(angle):
+    # Continuous positioning for face follow; pulses run until release_servo()
+    with servo_lock:
+        pwm.ChangeDutyCycle(angle_to_duty(angle))
+
+def release_servo():
+    with servo_lock:
+        pwm.ChangeDutyCycle(0)
+
+# Face follow: turns the head toward the largest tracked face at the
+# detection rate. The detect level is rotated 180 degrees from the stream
+# and servo angles grow to the right, hence direction=-1.
+face_follow_enabled = False
+face_follow_lock = threading.Lock()
+head_follow = HeadFollowController(set_servo_angle, release_servo, center=SERVO_POSITIONS['center'],
+                                   min_angle=SERVO_POSITIONS['left'], max_angle=SERVO_POSITIONS['right'],
+                                   direction=-1)
+
 # Camera Initialization
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
+# Live camera by default; R2D2_FRAME_SOURCE can point at a recorded clip
+camera = open_source()
 if not camera.isOpened():
     print("Error: Could not open camera.")
     exit()
 # Zoom out: set a wider field of view if possible
+# Ask for camera-side MJPG so frames can be passed through without re-encoding
+camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
 camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
 camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
 # Try to set focus to auto (if supported)
@@ -59,12 +111,38 @@ try:
     camera.set(cv2.CAP_PROP_AUTOFOCUS, 1)
 except Exception:
     pass
+# Keep the driver queue short; the capture thread always drains to the newest frame
+camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+# Reused frame buffers for the capture -> render path
+frame_pool = BufferPool()
+capture_thread = CaptureThread(camera, frame_pool)
+capture_thread.start()
+
+# Every resolution the vision threads need, resized once per captured frame
+DETECT_SIZE = (320, 180)
+DEPTH_INPUT_SIZE = (640, 192)  # Monodepth2 mono_640x192 input
+pyramid = FramePyramid(capture_thread, {
+    'detect': DETECT_SIZE + ('gray',),
+    'depth': DEPTH_INPUT_SIZE + ('bgr',),
+})
+pyramid.start()
+
+# Face and depth drop to a slow heartbeat while nothing in view moves
+motion = MotionGate()
+
+# Vision tasks share R2D2_VISION_CPU_BUDGET cores, after the stream and the
+# motor loop, which are never held back. Faces come before depth. The faces
+# task only times LK tracking and the hand-off to the worker pool; the
+# detection itself runs in the worker processes, so its measured use is
+# reserved as well.
+vision_scheduler = VisionScheduler(cpu_budget=float(os.environ.get('R2D2_VISION_CPU_BUDGET', '1.5')))
+vision_scheduler.reserve('stream', ('pyramid', 'overlay', 'encode'))
+vision_scheduler.reserve('control', ('control',))
+vision_scheduler.reserve('face_detect', ('detect',))
+face_task = vision_scheduler.register('faces', priority=1, rate=15, cost=0.01)
+depth_task = vision_scheduler.register('depth', priority=2, rate=5, cost=0.25)
 
 # Face detection setup
-cascade_path = "/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml"
-if not os.path.isfile(cascade_path):
-    cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-face_cascade = cv2.CascadeClassifier(cascade_path)
 face_detection_enabled = False
 face_detection_lock = threading.Lock()
 
@@ -91,64 +169,99 @@ motors_armed_lock = threading.Lock()
 
 # Async depth thread (Monodepth2)
 class DepthThread(threading.Thread):
-    def __init__(self, camera):
+    def __init__(self, pyramid):
         super().__init__(daemon=True)
-        self.camera = camera
+        self.pyramid = pyramid
         self.running = True
+        self.last_seq = 0
+        self.motion = motion.subscribe('depth', heartbeat=2.0)
+        self.task = depth_task
+        # Paces itself within whatever CPU the task scheduler leaves for depth,
+        # but never below the task's min_rate, like every scheduled task
+        self.scheduler = DepthScheduler(cpu_budget=depth_task.available, resolutions=md.resolutions,
+                                        min_rate=depth_task.min_rate)
+        # Inference outlives the pyramid ring, so keep a private input copy per size
+        self.inputs = {(w, h): np.empty((h, w, 3), np.uint8) for w, h in self.scheduler.resolutions}
     def run(self):
-        global last_depth_map
         while self.running:
-            ret, frame = self.camera.read()
-            if not ret:
-                time.sleep(0.01)
+            seq, _, levels, _ = self.pyramid.wait_next(self.last_seq)
+            if seq == self.last_seq:
+                continue
+            self.last_seq = seq
+            if not levels:
                 continue
             with depth_perception_lock:
                 enabled = depth_perception_enabled
-            if enabled:
-                # Evaluate depth using Monodepth2
-                depth = md.eval(frame)
-                # Normalize and colorize for overlay
-                depth_norm = cv2.normalize(depth, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
-                depth_color = cv2.applyColorMap(depth_norm, cv2.COLORMAP_JET)
-                with last_depth_lock:
-                    last_depth_map = depth_color
-            time.sleep(0.2)  # 5 FPS for low lag
-
-depth_thread = DepthThread(camera)
+            if not enabled:
+                continue
+            with motors_armed_lock:
+                armed = motors_armed
+            driving = armed and (current_throttle != 0 or current_steering != 0)
+            if not self.motion.ready(levels['detect'], seq) and not driving:
+                continue
+            vision_scheduler.rebalance()
+            self.scheduler.cpu_budget = self.task.available
+            size = self.scheduler.should_run(levels['detect'], driving)
+            if size is None:
+                continue
+            self.task.mark()
+            depth_input = self.inputs[size]
+            if size == DEPTH_INPUT_SIZE:
+                np.copyto(depth_input, levels['depth'])
+            else:
+                cv2.resize(levels['depth'], size, dst=depth_input, interpolation=cv2.INTER_AREA)
+            # Evaluate depth using Monodepth2
+            start = time.perf_counter()
+            with self.task.running(), tracer.stage('depth', seq):
+                depth = md.eval(depth_input)
+            self.scheduler.record(size, time.perf_counter() - start, levels['detect'])
+            obstacles.update(depth)
+            # Normalize and colorize once per depth map for the overlay
+            depth_overlay.update(depth)
+
+depth_thread = DepthThread(pyramid)
 depth_thread.start()
 
 # Async face detection thread
+# Full detection every 10th frame (or when tracking is lost), LK tracking in
+# between. Detection is asynchronous, so tracking continues while it runs.
 class FaceThread(threading.Thread):
-    def __init__(self, camera):
+    def __init__(self, pyramid):
         super().__init__(daemon=True)
-        self.camera = camera
+        self.pyramid = pyramid
         self.running = True
-        self.frame_count = 0
+        self.last_seq = 0
+        # Faces in the 320x180 detect level are small
+        self.tracker = FaceTracker(AsyncDetector(face_pool, min_size=(20, 20)), keyframe_interval=10)
+        self.motion = motion.subscribe('faces', heartbeat=1.0)
+        self.task = face_task
     def run(self):
         global last_face_boxes
         while self.running:
-            ret, frame = self.camera.read()
-            if not ret:
-                time.sleep(0.01)
+            seq, ts, levels, shape = self.pyramid.wait_next(self.last_seq)
+            if seq == self.last_seq:
                 continue
-            self.frame_count += 1
-            if self.frame_count % 3 != 0:
-                time.sleep(0.01)
+            self.last_seq = seq
+            if not levels:
                 continue
-            small = cv2.resize(frame, (320, 180))
-            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(20, 20))
+            if not self.motion.ready(levels['detect'], seq) or not self.task.ready():
+                continue
+            with self.task.running(), tracer.stage('faces', seq):
+                faces = self.tracker.update(levels['detect'])
+            with face_follow_lock:
+                follow = face_follow_enabled
+            if follow:
+                head_follow.update(faces, DETECT_SIZE[0], ts, seq)
             boxes = []
+            # Scale boxes back to full frame
+            fx = shape[1] / DETECT_SIZE[0]
+            fy = shape[0] / DETECT_SIZE[1]
             for (x, y, w, h) in faces:
-                # Scale boxes back to full frame
-                fx = frame.shape[1] / 320
-                fy = frame.shape[0] / 180
                 boxes.append((int(x*fx), int(y*fy), int(w*fx), int(h*fy)))
             with last_face_lock:
                 last_face_boxes = boxes
-            time.sleep(0.03)
 
-face_thread = FaceThread(camera)
+face_thread = FaceThread(pyramid)
 face_thread.start()
 
 # --- Utility Functions ---
@@ -182,6 +295,11 @@ def cleanup():
     global running
     running = False
     print("Stopping motors and releasing camera")
+    broadcaster.stop()
+    h264_stream.stop()
+    face_pool.close()
+    pyramid.stop()
+    capture_thread.stop()
     try:
         left_motor.stop()
     except Exception:
@@ -229,9 +347,13 @@ def motor_control_loop():
             right_motor.stop()
             time.sleep(MOTOR_UPDATE_INTERVAL)
             continue
+        start = time.perf_counter()
         # Map joystick values to motor speeds
         throttle = current_throttle  # -1 to 1
         steering = current_steering  # -1 to 1
+        if throttle > 0:
+            # Slow down, then stop, toward obstacles in the direction of travel
+            throttle *= obstacles.throttle_scale(steering)
         left_speed = throttle + steering
         right_speed = throttle - steering
         left_speed = max(-1, min(1, left_speed))
@@ -248,6 +370,7 @@ def motor_control_loop():
             right_motor.backward(-right_speed)
         else:
             right_motor.stop()
+        tracer.record('control', time.perf_counter() - start)
         time.sleep(MOTOR_UPDATE_INTERVAL)
 
 def play_random_segments():
@@ -255,36 +378,50 @@ def play_random_segments():
         play_audio("sound1.mp3", duration=2)
         time.sleep(random.uniform(5, 15))
 
-def generate_frames():
-    while running:
-        ret, frame = camera.read()
-        if not ret:
-            break
-        frame = cv2.flip(frame, -1)
-        # Depth perception mode
-        with depth_perception_lock:
-            show_depth = depth_perception_enabled
-        if show_depth:
-            with last_depth_lock:
-                if last_depth_map is not None:
-                    depth_color = cv2.resize(last_depth_map, (frame.shape[1], frame.shape[0]))
-                    frame = cv2.addWeighted(frame, 0.4, depth_color, 0.6, 0)
-        # Face detection mode
-        with face_detection_lock:
-            detect_faces = face_detection_enabled
-        if detect_faces and not show_depth:
-            with last_face_lock:
-                boxes = list(last_face_boxes)
-            for (x, y, w, h) in boxes:
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 142, 72), 4)
-                overlay = frame.copy()
-                cv2.rectangle(overlay, (x, y), (x+w, y+h), (255, 142, 72), -1)
-                alpha = 0.15
-                cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+# Runs once per captured frame on the broadcaster thread, shared by all viewers
+compositor = OverlayCompositor()
+
+def render_frame(frame):
+    out = frame_pool.get('display', frame.shape)
+    cv2.flip(frame, -1, dst=out)
+    compositor.begin(out)
+    # Depth perception mode
+    with depth_perception_lock:
+        show_depth = depth_perception_enabled
+    if show_depth:
+        # Resized only when a new depth map has arrived
+        depth_color, _ = depth_overlay.display(out.shape)
+        if depth_color is not None:
+            compositor.image(depth_color, 0.6)
+    # Face detection mode
+    with face_detection_lock:
+        detect_faces = face_detection_enabled
+    if detect_faces and not show_depth:
+        with last_face_lock:
+            boxes = list(last_face_boxes)
+        for box in boxes:
+            compositor.tint(box, (255, 142, 72), 0.15)
+            compositor.rectangle(box, (255, 142, 72), 4)
+    return compositor.compose()
+
+def decoded_frames_needed():
+    # Overlays draw on decoded frames, and face following feeds FaceThread
+    # from the pyramid, so any of them rules out MJPG passthrough
+    with face_detection_lock, depth_perception_lock:
+        if face_detection_enabled or depth_perception_enabled:
+            return True
+    with face_follow_lock:
+        return face_follow_enabled
+
+broadcaster = MJPEGBroadcaster(capture_thread, render_frame, decoded_frames_needed)
+broadcaster.start()
+video_ws_available = ws_video.attach(app, broadcaster)
+
+# Opt-in H.264 stream on /video_h264, encoded once from the rendered frames
+h264_stream = H264Broadcaster()
+if h264_stream.available:
+    h264_stream.start()
+    broadcaster.add_sink(h264_stream)
 
 # --- Flask Endpoints ---
 @app.route('/')
@@ -345,6 +482,18 @@ def index():
                 border-radius: 18px;
                 box-shadow: 0 4px 32px 0 #000a;
             }
+            #frame-info {
+                position: absolute;
+                top: 40px;
+                right: 40px;
+                z-index: 3;
+                font-size: 0.9rem;
+                color: #f5f6fa;
+                background: rgba(24,26,32,0.85);
+                border-radius: 8px;
+                padding: 6px 12px;
+                display: none;
+            }
             #joystick-container {
                 position: absolute;
                 top: 40px;
@@ -505,6 +654,26 @@ def index():
                 letter-spacing: 0.04em;
                 margin-left: 8px;
             }
+            #face-follow-switch-container {
+                position: absolute;
+                top: 380px;
+                left: 40px;
+                z-index: 4;
+                display: flex;
+                align-items: center;
+                gap: 16px;
+                background: rgba(24,26,32,0.85);
+                border-radius: 18px;
+                box-shadow: 0 4px 32px 0 #000a;
+                padding: 14px 24px;
+            }
+            #face-follow-label {
+                font-size: 1.1rem;
+                font-weight: 500;
+                color: #f5f6fa;
+                letter-spacing: 0.04em;
+                margin-left: 8px;
+            }
             @media (max-width: 900px) {
                 #servo-controls {
                     flex-direction: column;
@@ -536,6 +705,7 @@ def index():
             <div id="camera-container">
                 <img id="camera-feed" src="{{ url_for('video_feed') }}" alt="Camera Feed" />
             </div>
+            <div id="frame-info"></div>
             <div id="joystick-container">
                 <div id="joystick"></div>
             </div>
@@ -560,6 +730,13 @@ def index():
                 </label>
                 <span id="depth-perception-label">Depth Perception Off</span>
             </div>
+            <div id="face-follow-switch-container">
+                <label class="switch">
+                  <input type="checkbox" id="face-follow-switch">
+                  <span class="slider"></span>
+                </label>
+                <span id="face-follow-label">Face Follow Off</span>
+            </div>
             <div id="servo-controls">
                 <button class="servo-btn" data-pos="left">Left</button>
                 <button class="servo-btn" data-pos="left-center">Left-Center</button>
@@ -607,6 +784,11 @@ def index():
             $('.servo-btn').click(function() {
                 var pos = $(this).data('pos');
                 setServoPosition(pos);
+                // A manual position ends face follow on the server
+                if (followSwitch.checked) {
+                    followSwitch.checked = false;
+                    showFaceFollowState(false);
+                }
             });
             $(function() {
                 setServoPosition('{{ current_servo_position }}');
@@ -664,6 +846,74 @@ def index():
             });
             // Set initial state
             setDepthPerceptionState(false);
+            // Face follow switch logic
+            var followSwitch = document.getElementById('face-follow-switch');
+            var followLabel = document.getElementById('face-follow-label');
+            function showFaceFollowState(enabled) {
+                followLabel.textContent = enabled ? 'Face Follow On' : 'Face Follow Off';
+                followLabel.style.color = enabled ? '#4e8cff' : '#f5f6fa';
+            }
+            function setFaceFollowState(enabled) {
+                $.post('/face_follow', {state: enabled ? 'true' : 'false'});
+                showFaceFollowState(enabled);
+            }
+            followSwitch.addEventListener('change', function() {
+                setFaceFollowState(followSwitch.checked);
+            });
+            // Set initial state
+            setFaceFollowState(false);
+            // WebSocket video: binary frames carry a sequence number and
+            // capture time; each one is acknowledged once displayed so the
+            // server skips frames instead of queueing them
+            function startVideoSocket() {
+                var img = document.getElementById('camera-feed');
+                var info = document.getElementById('frame-info');
+                var scheme = location.protocol === 'https:' ? 'wss://' : 'ws://';
+                var ws = new WebSocket(scheme + location.host + '/video_ws');
+                var lastUrl = null;
+                var pendingUrl = null;
+                ws.binaryType = 'arraybuffer';
+                ws.onmessage = function(evt) {
+                    var view = new DataView(evt.data);
+                    var seq = view.getUint32(0, true);
+                    var captured = view.getFloat64(4, true);
+                    var blob = new Blob([new Uint8Array(evt.data, 12)], {type: 'image/jpeg'});
+                    var url = URL.createObjectURL(blob);
+                    if (pendingUrl) {
+                        // Superseded before it finished loading
+                        URL.revokeObjectURL(pendingUrl);
+                    }
+                    pendingUrl = url;
+                    img.onload = function() {
+                        pendingUrl = null;
+                        if (lastUrl) {
+                            URL.revokeObjectURL(lastUrl);
+                        }
+                        lastUrl = url;
+                        ws.send(JSON.stringify({ack: seq}));
+                        var age = Math.max(0, Date.now() - captured * 1000);
+                        info.style.display = 'block';
+                        info.textContent = 'Frame ' + seq + ' - ' + age.toFixed(0) + ' ms';
+                    };
+                    img.onerror = function() {
+                        // Undecodable frame: still acknowledge it so the server keeps sending
+                        pendingUrl = null;
+                        URL.revokeObjectURL(url);
+                        ws.send(JSON.stringify({ack: seq}));
+                    };
+                    img.src = url;
+                };
+                ws.onclose = function() {
+                    // Fall back to the multipart stream
+                    img.onload = null;
+                    img.onerror = null;
+                    info.style.display = 'none';
+                    img.src = '{{ url_for('video_feed') }}';
+                };
+            }
+            if ({{ 'true' if video_ws_available else 'false' }} && window.WebSocket) {
+                startVideoSocket();
+            }
             // Shutdown button logic
             $('#shutdown-btn').click(function() {
                 if (confirm('Are you sure you want to shutdown the server?')) {
@@ -675,20 +925,74 @@ def index():
         </script>
     </body>
     </html>
-    ''', current_servo_position=current_servo_position)
+    ''', current_servo_position=current_servo_position, video_ws_available=video_ws_available)
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/video_h264')
+def video_h264():
+    if not h264_stream.available:
+        return 'H.264 streaming needs PyAV (pip install av)', 404
+    return Response(h264_stream.stream(), mimetype='video/mp4')
+
+@app.route('/h264_settings', methods=['GET', 'POST'])
+def h264_settings():
+    if request.method == 'POST':
+        h264_stream.configure(bitrate=request.form.get('bitrate', type=int),
+                              keyframe_interval=request.form.get('keyframe_interval', type=int))
+    return jsonify(h264_stream.stats())
+
+@app.route('/stream_mode')
+def stream_mode():
+    return jsonify(passthrough=broadcaster.passthrough)
+
+@app.route('/stream_stats')
+def stream_stats():
+    # Current quality/scale/fps decision and measured latency per viewer
+    return jsonify(clients=broadcaster.stats(), buffers=frame_pool.stats(),
+                   depth=dict(depth_thread.scheduler.stats(), overlay=depth_overlay.stats(),
+                              obstacles=obstacles.stats()),
+                   motion=motion.stats(), head_follow=head_follow.stats(),
+                   scheduler=vision_scheduler.stats())
+
+@app.route('/metrics')
+def metrics():
+    # Per-stage pipeline latency in Prometheus text format
+    return Response(tracer.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics.json')
+def metrics_json():
+    return jsonify(stages=tracer.snapshot())
 
 @app.route('/set_servo', methods=['POST'])
 def set_servo():
-    global current_servo_position
+    global current_servo_position, face_follow_enabled
     pos = request.form.get('position')
     if pos in SERVO_POSITIONS:
+        with face_follow_lock:
+            following = face_follow_enabled
+            face_follow_enabled = False
+        if following:
+            # The head is somewhere in between; move it even if pos is unchanged
+            set_servo_position(pos)
         current_servo_position = pos
     return 'OK'
 
+@app.route('/face_follow', methods=['POST'])
+def face_follow():
+    global face_follow_enabled
+    state = request.form.get('state') == 'true'
+    with face_follow_lock:
+        was_enabled = face_follow_enabled
+        face_follow_enabled = state
+    if state and not was_enabled:
+        head_follow.reset(SERVO_POSITIONS.get(current_servo_position, SERVO_POSITIONS['center']))
+    elif was_enabled and not state:
+        set_servo_position(current_servo_position)
+    return 'OK'
+
 @app.route('/joystick', methods=['POST'])
 def joystick():
     global current_throttle, current_steering
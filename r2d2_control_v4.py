@@ -4,12 +4,22 @@ import time
 import cv2
 import numpy as np
 import threading
-from flask import Flask, Response, render_template_string, request
+from flask import Flask, Response, jsonify, render_template_string, request
 import subprocess
 import random
 import RPi.GPIO as GPIO
 import urllib.request
 from gpiozero import Motor
+from vision.capture import CaptureThread
+from vision.frame_source import open_source
+from vision.buffers import BufferPool
+from vision.tracing import tracer
+from vision.broadcast import MJPEGBroadcaster
+from vision import ws_video
+from vision.h264 import H264Broadcaster
+from vision.face_workers import FaceWorkerPool
+from vision.overlay import OverlayCompositor
+from vision.motion import MotionGate
 
 app = Flask(__name__)
 
@@ -35,15 +45,22 @@ current_servo_position = 'center'
 servo_lock = threading.Lock()
 
 # Camera and face detection setup (from v1)
-cascade_path = "/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml"
-if not os.path.isfile(cascade_path):
-    print(f"Error: Cascade file not found at {cascade_path}")
+# Haar cascade by default; R2D2_FACE_DETECTOR selects lbp, ssd or yunet.
+# Detection runs in a forked worker process (started before any of our
+# threads) that searches around the last faces, with a full-frame scan
+# every 15 frames; the stream only ever draws the latest boxes.
+try:
+    face_pool = FaceWorkerPool(workers=1, max_shape=(720, 1280), roi=True)
+except (FileNotFoundError, ValueError) as e:
+    print(f"Error: {e}")
     exit()
-face_cascade = cv2.CascadeClassifier(cascade_path)
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
+# Live camera by default; R2D2_FRAME_SOURCE can point at a recorded clip
+camera = open_source()
 if not camera.isOpened():
     print("Error: Could not open camera.")
     exit()
+# Ask for camera-side MJPG so frames can be passed through without re-encoding
+camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
 camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
 camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
 # Try to set focus to auto (if supported)
@@ -51,6 +68,12 @@ try:
     camera.set(cv2.CAP_PROP_AUTOFOCUS, 1)
 except Exception:
     pass
+# Keep the driver queue short; the capture thread always drains to the newest frame
+camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+# Reused frame buffers for the capture -> render path
+frame_pool = BufferPool()
+capture_thread = CaptureThread(camera, frame_pool)
+capture_thread.start()
 
 # Motor control state
 current_throttle = 0.0
@@ -111,6 +134,10 @@ def cleanup():
     global running
     running = False
     print("Stopping motors and releasing camera")
+    broadcaster.stop()
+    h264_stream.stop()
+    face_pool.close()
+    capture_thread.stop()
     try:
         left_motor.stop()
     except Exception:
@@ -184,28 +211,43 @@ def play_random_segments():
         play_audio("sound1.mp3", duration=2)
         time.sleep(random.uniform(5, 15))
 
-def generate_frames():
-    while running:
-        ret, frame = camera.read()
-        if not ret:
-            time.sleep(0.01)
-            continue
-        frame = cv2.flip(frame, -1)
-        with face_detection_lock:
-            detect_faces = face_detection_enabled
-        if detect_faces:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
-                cv2.drawMarker(frame, (x, y), (0, 255, 0), cv2.MARKER_CROSS, 10, 2)
-                cv2.drawMarker(frame, (x+w, y), (0, 255, 0), cv2.MARKER_CROSS, 10, 2)
-                cv2.drawMarker(frame, (x, y+h), (0, 255, 0), cv2.MARKER_CROSS, 10, 2)
-                cv2.drawMarker(frame, (x+w, y+h), (0, 255, 0), cv2.MARKER_CROSS, 10, 2)
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+compositor = OverlayCompositor()
+# Detection drops to a slow heartbeat while nothing in view moves
+motion = MotionGate()
+face_motion = motion.subscribe('faces', heartbeat=1.0)
+
+# Runs once per captured frame on the broadcaster thread, shared by all viewers
+def render_frame(frame):
+    out = frame_pool.get('display', frame.shape)
+    frame = cv2.flip(frame, -1, dst=out)
+    with face_detection_lock:
+        detect_faces = face_detection_enabled
+    if detect_faces:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=frame_pool.get('gray', frame.shape[:2]))
+        if face_motion.ready(gray):
+            face_pool.submit(gray)
+        _, faces = face_pool.latest()
+        compositor.begin(frame)
+        for (x, y, w, h) in faces:
+            compositor.rectangle((x, y, w, h), (255, 0, 0), 2)
+            for corner in ((x, y), (x+w, y), (x, y+h), (x+w, y+h)):
+                compositor.marker(corner, (0, 255, 0))
+        compositor.compose()
+    return frame
+
+def decoded_frames_needed():
+    with face_detection_lock:
+        return face_detection_enabled
+
+broadcaster = MJPEGBroadcaster(capture_thread, render_frame, decoded_frames_needed)
+broadcaster.start()
+video_ws_available = ws_video.attach(app, broadcaster)
+
+# Opt-in H.264 stream on /video_h264, encoded once from the rendered frames
+h264_stream = H264Broadcaster()
+if h264_stream.available:
+    h264_stream.start()
+    broadcaster.add_sink(h264_stream)
 
 # --- Flask Endpoints ---
 @app.route('/')
@@ -266,6 +308,18 @@ def index():
                 border-radius: 18px;
                 box-shadow: 0 4px 32px 0 #000a;
             }
+            #frame-info {
+                position: absolute;
+                top: 40px;
+                right: 40px;
+                z-index: 3;
+                font-size: 0.9rem;
+                color: #f5f6fa;
+                background: rgba(24,26,32,0.85);
+                border-radius: 8px;
+                padding: 6px 12px;
+                display: none;
+            }
             #joystick-container {
                 position: absolute;
                 top: 40px;
@@ -437,6 +491,7 @@ def index():
             <div id="camera-container">
                 <img id="camera-feed" src="{{ url_for('video_feed') }}" alt="Camera Feed" />
             </div>
+            <div id="frame-info"></div>
             <div id="joystick-container">
                 <div id="joystick"></div>
             </div>
@@ -541,6 +596,58 @@ def index():
             });
             // Set initial state
             setFaceDetectionState(false);
+            // WebSocket video: binary frames carry a sequence number and
+            // capture time; each one is acknowledged once displayed so the
+            // server skips frames instead of queueing them
+            function startVideoSocket() {
+                var img = document.getElementById('camera-feed');
+                var info = document.getElementById('frame-info');
+                var scheme = location.protocol === 'https:' ? 'wss://' : 'ws://';
+                var ws = new WebSocket(scheme + location.host + '/video_ws');
+                var lastUrl = null;
+                var pendingUrl = null;
+                ws.binaryType = 'arraybuffer';
+                ws.onmessage = function(evt) {
+                    var view = new DataView(evt.data);
+                    var seq = view.getUint32(0, true);
+                    var captured = view.getFloat64(4, true);
+                    var blob = new Blob([new Uint8Array(evt.data, 12)], {type: 'image/jpeg'});
+                    var url = URL.createObjectURL(blob);
+                    if (pendingUrl) {
+                        // Superseded before it finished loading
+                        URL.revokeObjectURL(pendingUrl);
+                    }
+                    pendingUrl = url;
+                    img.onload = function() {
+                        pendingUrl = null;
+                        if (lastUrl) {
+                            URL.revokeObjectURL(lastUrl);
+                        }
+                        lastUrl = url;
+                        ws.send(JSON.stringify({ack: seq}));
+                        var age = Math.max(0, Date.now() - captured * 1000);
+                        info.style.display = 'block';
+                        info.textContent = 'Frame ' + seq + ' - ' + age.toFixed(0) + ' ms';
+                    };
+                    img.onerror = function() {
+                        // Undecodable frame: still acknowledge it so the server keeps sending
+                        pendingUrl = null;
+                        URL.revokeObjectURL(url);
+                        ws.send(JSON.stringify({ack: seq}));
+                    };
+                    img.src = url;
+                };
+                ws.onclose = function() {
+                    // Fall back to the multipart stream
+                    img.onload = null;
+                    img.onerror = null;
+                    info.style.display = 'none';
+                    img.src = '{{ url_for('video_feed') }}';
+                };
+            }
+            if ({{ 'true' if video_ws_available else 'false' }} && window.WebSocket) {
+                startVideoSocket();
+            }
             // Shutdown button logic
             $('#shutdown-btn').click(function() {
                 if (confirm('Are you sure you want to shutdown the server?')) {
@@ -552,11 +659,43 @@ def index():
         </script>
     </body>
     </html>
-    ''', current_servo_position=current_servo_position)
+    ''', current_servo_position=current_servo_position, video_ws_available=video_ws_available)
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/video_h264')
+def video_h264():
+    if not h264_stream.available:
+        return 'H.264 streaming needs PyAV (pip install av)', 404
+    return Response(h264_stream.stream(), mimetype='video/mp4')
+
+@app.route('/h264_settings', methods=['GET', 'POST'])
+def h264_settings():
+    if request.method == 'POST':
+        h264_stream.configure(bitrate=request.form.get('bitrate', type=int),
+                              keyframe_interval=request.form.get('keyframe_interval', type=int))
+    return jsonify(h264_stream.stats())
+
+@app.route('/stream_mode')
+def stream_mode():
+    return jsonify(passthrough=broadcaster.passthrough)
+
+@app.route('/stream_stats')
+def stream_stats():
+    # Current quality/scale/fps decision and measured latency per viewer
+    return jsonify(clients=broadcaster.stats(), buffers=frame_pool.stats(), faces=face_pool.stats(),
+                   motion=motion.stats())
+
+@app.route('/metrics')
+def metrics():
+    # Per-stage pipeline latency in Prometheus text format
+    return Response(tracer.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics.json')
+def metrics_json():
+    return jsonify(stages=tracer.snapshot())
 
 @app.route('/set_servo', methods=['POST'])
 def set_servo():
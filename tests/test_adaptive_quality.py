@@ -0,0 +1,107 @@
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision import broadcast
+from vision.broadcast import QUALITY_LEVELS, AdaptiveQuality, MJPEGBroadcaster, StreamClient
+
+
+class FakeClock:
+    # Stands in for the time module inside vision.broadcast
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeCapture:
+    # 30 fps decoded frames on the fake clock, the interface
+    # MJPEGBroadcaster reads. Stops the broadcaster after `frames` frames.
+    def __init__(self, clock, broadcaster=None, fps=30, frames=300, jitter=0.002):
+        self.clock = clock
+        self.broadcaster = broadcaster
+        self.fps = fps
+        self.frames = frames
+        self.rng = random.Random(1)
+        self.jitter = jitter
+        self.raw = False
+        self.seq = 0
+        self.start = clock.now
+        self.frame = np.zeros((72, 128, 3), np.uint8)
+
+    def set_raw(self, raw):
+        pass
+
+    def wait_packet(self, last_seq, timeout=1.0):
+        # Frames arrive on the camera's clock, whatever the consumer does;
+        # a slow consumer misses frames rather than delaying them
+        self.seq = max(self.seq, int((self.clock.now - self.start) * self.fps))
+        self.seq += 1
+        arrival = self.start + self.seq / self.fps + self.rng.uniform(0, self.jitter)
+        self.clock.now = max(self.clock.now, arrival)
+        if self.seq >= self.frames:
+            self.broadcaster.running = False
+        return self.seq, self.clock.now, self.frame, None
+
+
+class AdaptiveQualityTest(unittest.TestCase):
+    def send_rate(self, level, jitter=0.002, seconds=10.0, camera_fps=30):
+        client = StreamClient()
+        client.controller.level = level
+        rng = random.Random(1)
+        sent = 0
+        for i in range(int(seconds * camera_fps)):
+            now = 1000.0 + i / camera_fps + rng.uniform(-jitter, jitter)
+            if client.controller.allow(now):
+                client.put((i, now, b''), now)
+                sent += 1
+        return sent / seconds
+
+    def test_full_rate_at_best_level(self):
+        self.assertGreaterEqual(self.send_rate(0), 29.5)
+
+    def test_level_rate_is_capped(self):
+        for level, (_, _, fps) in enumerate(QUALITY_LEVELS):
+            rate = self.send_rate(level)
+            self.assertLessEqual(rate, fps * 1.1 + 0.5, level)
+            self.assertGreaterEqual(rate, min(fps, 30) * 0.6, level)
+
+    def test_steps_down_when_client_falls_behind(self):
+        controller = AdaptiveQuality(target_latency=0.2)
+        for _ in range(10):
+            controller.observe(1.0, dropped=False)
+        self.assertEqual(controller.level, 1)
+
+    def test_broadcaster_keeps_camera_rate(self):
+        clock = FakeClock()
+        capture = FakeCapture(clock, frames=300)
+
+        def slow_render(frame):
+            # Render plus encode take a good part of a frame interval
+            clock.sleep(0.01)
+            return frame
+
+        broadcaster = MJPEGBroadcaster(capture, slow_render)
+        capture.broadcaster = broadcaster
+        client = broadcaster.subscribe(queue_size=300)
+        start = clock.now
+        # Run the loop on this thread; the capture stops it after 300 frames
+        with mock.patch.object(broadcast, 'time', clock):
+            broadcaster.run()
+        self.assertGreaterEqual(len(client.frames) / (clock.now - start), 29)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.depth_scheduler import DEPTH_RESOLUTIONS, DepthScheduler
+
+
+def run(scheduler, gray, seconds, driving=False, cost=0.2, step=1 / 30):
+    # Feeds frames at 30 fps for `seconds` and returns the sizes that ran
+    ran = []
+    now = 1000.0
+    end = now + seconds
+    while now < end:
+        size = scheduler.should_run(gray, driving, now)
+        if size is not None:
+            scheduler.record(size, cost, gray, now)
+            ran.append(size)
+        now += step
+    return ran
+
+
+class DepthSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def frame(self):
+        return self.rng.integers(0, 255, (96, 160), np.uint8)
+
+    def test_starved_budget_falls_back_to_min_rate(self):
+        scheduler = DepthScheduler(cpu_budget=0.0, min_rate=0.5)
+        gray = self.frame()
+        # Every size gets tried once, then the floor takes over
+        ran = run(scheduler, gray, 20.0, driving=True)
+        self.assertGreaterEqual(len(ran), len(DEPTH_RESOLUTIONS) + 5)
+        self.assertEqual(ran[-1], DEPTH_RESOLUTIONS[-1])
+
+    def test_no_floor_and_no_budget_skips(self):
+        scheduler = DepthScheduler(cpu_budget=0.0, min_rate=0.0)
+        gray = self.frame()
+        ran = run(scheduler, gray, 20.0, driving=True)
+        self.assertEqual(len(ran), len(DEPTH_RESOLUTIONS))
+
+    def test_picks_largest_size_within_budget(self):
+        scheduler = DepthScheduler(cpu_budget=0.5, target_rate=5.0)
+        for size, cost in zip(DEPTH_RESOLUTIONS, (0.2, 0.12, 0.08, 0.05)):
+            scheduler.costs[size] = cost
+        # 0.12 s x 5 Hz is over half a core, 0.08 s x 5 Hz is not
+        self.assertEqual(scheduler.resolution(driving=False), DEPTH_RESOLUTIONS[2])
+        self.assertAlmostEqual(scheduler.rate(DEPTH_RESOLUTIONS[2], driving=False), 5.0)
+
+    def test_static_scene_drops_to_idle_rate(self):
+        scheduler = DepthScheduler(cpu_budget=4.0, target_rate=5.0, idle_rate=0.5)
+        gray = self.frame()
+        ran = run(scheduler, gray, 10.0, cost=0.01)
+        # First run, then one every 1 / idle_rate seconds
+        self.assertLessEqual(len(ran), 7)
+        self.assertGreater(scheduler.skipped_static, 0)
+
+    def test_changing_scene_runs_at_target_rate(self):
+        scheduler = DepthScheduler(cpu_budget=4.0, target_rate=5.0)
+        frames = [self.frame() for _ in range(4)]
+        ran = []
+        now = 1000.0
+        for i in range(300):
+            gray = frames[i % 4]
+            size = scheduler.should_run(gray, False, now)
+            if size is not None:
+                scheduler.record(size, 0.01, gray, now)
+                ran.append(size)
+            now += 1 / 30
+        self.assertGreaterEqual(len(ran), 40)
+        self.assertLessEqual(len(ran), 51)
+
+
+if __name__ == '__main__':
+    unittest.main()
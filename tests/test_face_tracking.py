@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.face_tracking import FaceTracker
+
+
+def scene(x, y, patch, size=(180, 320)):
+    # Flat background with a textured "face" whose top-left corner is (x, y)
+    gray = np.full(size, 90, np.uint8)
+    h, w = patch.shape
+    gray[y:y + h, x:x + w] = patch
+    return gray
+
+
+class DelayedDetector:
+    # Stands in for AsyncDetector: boxes come back `delay` calls after the
+    # frame they were found on, and `source` holds that frame
+    def __init__(self, find, delay=3):
+        self.find = find
+        self.delay = delay
+        self.pending = None
+        self.source = None
+
+    def __call__(self, gray):
+        if self.pending is None:
+            self.source = gray.copy()
+            self.pending = [self.find(gray), self.delay]
+            return None
+        self.pending[1] -= 1
+        if self.pending[1] > 0:
+            return None
+        boxes, self.pending = self.pending[0], None
+        return boxes
+
+
+class FaceTrackerTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.patch = rng.integers(0, 255, (40, 40), np.uint8)
+        self.position = None
+
+    def find(self, gray):
+        return [(self.position[0], self.position[1], 40, 40)]
+
+    def test_late_boxes_are_tracked_to_the_current_frame(self):
+        tracker = FaceTracker(DelayedDetector(self.find), keyframe_interval=100)
+        # The face moves 4 px per frame while detection is in flight
+        for i in range(6):
+            self.position = (60 + 4 * i, 70)
+            boxes = tracker.update(scene(*self.position, self.patch))
+        self.assertEqual(len(boxes), 1)
+        x, y, w, h = boxes[0]
+        self.assertLessEqual(abs(x - self.position[0]), 2)
+        self.assertLessEqual(abs(y - self.position[1]), 2)
+
+    def test_tracks_between_keyframes(self):
+        tracker = FaceTracker(lambda gray: self.find(gray), keyframe_interval=100)
+        for i in range(10):
+            self.position = (60 + 3 * i, 70 + i)
+            boxes = tracker.update(scene(*self.position, self.patch))
+        x, y, w, h = boxes[0]
+        self.assertLessEqual(abs(x - self.position[0]), 2)
+        self.assertLessEqual(abs(y - self.position[1]), 2)
+        self.assertEqual(tracker.detections, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
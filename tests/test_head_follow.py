@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.head_follow import HeadFollowController
+
+
+class HeadFollowControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.angles = []
+        self.releases = 0
+
+    def controller(self, **kwargs):
+        def release():
+            self.releases += 1
+        return HeadFollowController(self.angles.append, release, **kwargs)
+
+    def face_at(self, offset, width=320, size=40):
+        # A box whose centre is `offset` (in [-1, 1]) from the image centre
+        cx = width / 2 * (1 + offset)
+        return [(cx - size / 2, 60, size, size)]
+
+    def test_centred_face_is_left_alone(self):
+        head = self.controller(deadband=0.08)
+        self.assertIsNone(head.update(self.face_at(0.05), 320, now=1000.0))
+        self.assertEqual(self.angles, [])
+
+    def test_turns_towards_the_face(self):
+        head = self.controller(center=80, gain=25.0, max_rate=1000.0)
+        angle = head.update(self.face_at(0.4), 320, now=1000.0)
+        self.assertAlmostEqual(angle, 90.0)
+        self.assertEqual(self.angles, [angle])
+        head = self.controller(center=80, gain=25.0, max_rate=1000.0, direction=-1)
+        self.assertAlmostEqual(head.update(self.face_at(0.4), 320, now=1000.0), 70.0)
+
+    def test_step_is_rate_limited(self):
+        head = self.controller(center=80, gain=25.0, max_rate=50.0)
+        head.update(self.face_at(1.0), 320, now=1000.0)
+        # 50 deg/s over the 0.1 s assumed for the first update
+        self.assertAlmostEqual(self.angles[-1], 85.0)
+        head.update(self.face_at(1.0), 320, now=1000.05)
+        self.assertAlmostEqual(self.angles[-1], 87.5)
+
+    def test_angle_is_clamped(self):
+        head = self.controller(center=135, max_angle=140, max_rate=1000.0)
+        head.update(self.face_at(1.0), 320, now=1000.0)
+        self.assertEqual(self.angles[-1], 140)
+        # Already at the limit: no command
+        self.assertIsNone(head.update(self.face_at(1.0), 320, now=1000.1))
+
+    def test_tiny_steps_are_skipped(self):
+        head = self.controller(gain=5.0, deadband=0.0, min_step=1.0)
+        self.assertIsNone(head.update(self.face_at(0.1), 320, now=1000.0))
+        self.assertEqual(self.angles, [])
+
+    def test_largest_face_wins(self):
+        head = self.controller(center=80, gain=25.0, max_rate=1000.0)
+        boxes = self.face_at(-0.8, size=20) + self.face_at(0.4, size=60)
+        self.assertAlmostEqual(head.update(boxes, 320, now=1000.0), 90.0)
+
+    def test_releases_servo_once_still(self):
+        head = self.controller(release_after=0.5, max_rate=1000.0)
+        head.update(self.face_at(0.5), 320, now=1000.0)
+        head.update([], 320, now=1000.2)
+        self.assertEqual(self.releases, 0)
+        head.update([], 320, now=1000.6)
+        head.update([], 320, now=1000.8)
+        self.assertEqual(self.releases, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
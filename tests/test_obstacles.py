@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.obstacles import ObstacleSectors
+
+
+def disparity_for(depth, min_depth=0.1, max_depth=100.0):
+    # Inverse of Monodepth2's disp_to_depth
+    min_disp, max_disp = 1.0 / max_depth, 1.0 / min_depth
+    return (1.0 / depth - min_disp) / (max_disp - min_disp)
+
+
+class ObstacleSectorsTest(unittest.TestCase):
+    def scene(self, near_sector=None, near=0.4, far=5.0, sectors=5, shape=(96, 320)):
+        # Everything at `far` metres except one sector, as displayed
+        # (left to right) on the stream
+        disp = np.full(shape, disparity_for(far), np.float32)
+        if near_sector is not None:
+            w = shape[1] // sectors
+            disp[:, near_sector * w:(near_sector + 1) * w] = disparity_for(near)
+        return disp
+
+    def test_reduce_recovers_depth(self):
+        sectors = ObstacleSectors(flipped=False)
+        distances = sectors.reduce(self.scene(near_sector=1))
+        self.assertAlmostEqual(distances[1], 0.4, places=3)
+        for i in (0, 2, 3, 4):
+            self.assertAlmostEqual(distances[i], 5.0, places=2)
+
+    def test_flipped_camera_mirrors_sectors(self):
+        # The depth map comes from the upside-down camera, so what shows up
+        # on the left of the stream is on the right of the raw map
+        sectors = ObstacleSectors(flipped=True)
+        distances = sectors.reduce(self.scene(near_sector=4))
+        self.assertAlmostEqual(distances[0], 0.4, places=3)
+        self.assertAlmostEqual(distances[4], 5.0, places=2)
+
+    def test_flipped_band_uses_mirrored_rows(self):
+        sectors = ObstacleSectors(flipped=True, rows=(0.0, 0.25))
+        disp = self.scene()
+        # Near object only in the bottom quarter of the raw (upside-down) map
+        disp[72:, :] = disparity_for(0.4)
+        self.assertAlmostEqual(min(sectors.reduce(disp)), 0.4, places=3)
+
+    def test_percentile_ignores_a_few_noisy_pixels(self):
+        sectors = ObstacleSectors(flipped=False)
+        disp = self.scene()
+        disp[40, 10] = disparity_for(0.2)
+        self.assertAlmostEqual(sectors.reduce(disp)[0], 5.0, places=2)
+
+    def test_throttle_scale(self):
+        sectors = ObstacleSectors(flipped=False, stop_distance=0.5, slow_distance=1.5)
+        sectors.update(self.scene(near_sector=2, near=1.0), now=1000.0)
+        # Straight ahead is halfway between stop and slow distance
+        self.assertAlmostEqual(sectors.throttle_scale(0.0, now=1000.0), 0.5, places=2)
+        # Hard left or right steers clear of it
+        self.assertEqual(sectors.throttle_scale(-1.0, now=1000.0), 1.0)
+        self.assertEqual(sectors.throttle_scale(1.0, now=1000.0), 1.0)
+        # Between sectors the nearer one counts
+        self.assertAlmostEqual(sectors.throttle_scale(0.25, now=1000.0), 0.5, places=2)
+
+    def test_stops_inside_stop_distance(self):
+        sectors = ObstacleSectors(flipped=False)
+        sectors.update(self.scene(near_sector=2, near=0.3), now=1000.0)
+        self.assertEqual(sectors.throttle_scale(0.0, now=1000.0), 0.0)
+
+    def test_stale_map_does_not_brake(self):
+        sectors = ObstacleSectors(flipped=False, max_age=3.0)
+        sectors.update(self.scene(near_sector=2, near=0.3), now=1000.0)
+        self.assertIsNone(sectors.latest(now=1004.0))
+        self.assertEqual(sectors.throttle_scale(0.0, now=1004.0), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision import task_scheduler
+from vision.task_scheduler import RATE_WINDOW, VisionScheduler
+
+
+class FakeTracer:
+    def __init__(self, stages=None):
+        self.stages = stages or {}
+
+    def snapshot(self):
+        return self.stages
+
+
+def stage(fps, ms):
+    return {'fps': fps, 'p50_ms': ms}
+
+
+class VisionSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.tracer = FakeTracer()
+        patcher = mock.patch.object(task_scheduler, 'tracer', self.tracer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_full_rate_when_budget_allows(self):
+        scheduler = VisionScheduler(cpu_budget=1.5)
+        faces = scheduler.register('faces', priority=1, rate=15, cost=0.01)
+        depth = scheduler.register('depth', priority=2, rate=5, cost=0.1)
+        scheduler.rebalance(now=1000.0)
+        self.assertEqual(faces.allowed_rate, 15)
+        self.assertEqual(depth.allowed_rate, 5)
+        self.assertAlmostEqual(depth.available, 1.5 - 0.15)
+
+    def test_reserved_work_comes_off_the_budget_first(self):
+        # The stream uses 30 fps x 20 ms = 0.6 cores, detection 0.3
+        self.tracer.stages = {'encode': stage(30, 20), 'detect': stage(3, 100)}
+        scheduler = VisionScheduler(cpu_budget=1.0)
+        scheduler.reserve('stream', ('pyramid', 'encode'))
+        scheduler.reserve('face_detect', ('detect',))
+        faces = scheduler.register('faces', priority=1, rate=15, cost=0.01)
+        depth = scheduler.register('depth', priority=2, rate=5, cost=0.25)
+        scheduler.rebalance(now=1000.0)
+        self.assertAlmostEqual(scheduler.reserved_use['stream'], 0.6)
+        self.assertAlmostEqual(faces.available, 0.1)
+        # Faces take 0.1 cores at 10 Hz; nothing is left for depth
+        self.assertAlmostEqual(faces.allowed_rate, 10.0)
+        self.assertEqual(depth.available, 0.0)
+
+    def test_starved_task_keeps_min_rate(self):
+        self.tracer.stages = {'encode': stage(30, 50)}
+        scheduler = VisionScheduler(cpu_budget=1.0)
+        scheduler.reserve('stream', ('encode',))
+        depth = scheduler.register('depth', priority=2, rate=5, cost=0.25, min_rate=0.5)
+        scheduler.rebalance(now=1000.0)
+        self.assertEqual(depth.available, 0.0)
+        self.assertEqual(depth.allowed_rate, 0.5)
+
+    def test_higher_priority_is_served_first(self):
+        scheduler = VisionScheduler(cpu_budget=0.2)
+        depth = scheduler.register('depth', priority=2, rate=5, cost=0.1)
+        faces = scheduler.register('faces', priority=1, rate=15, cost=0.01)
+        scheduler.rebalance(now=1000.0)
+        self.assertEqual(faces.allowed_rate, 15)
+        self.assertAlmostEqual(depth.allowed_rate, 0.5)
+
+    def test_measured_cost_replaces_declared(self):
+        scheduler = VisionScheduler(cpu_budget=0.5)
+        depth = scheduler.register('depth', priority=2, rate=5, cost=0.05)
+        depth.record(0.2)
+        scheduler.rebalance(now=1000.0)
+        self.assertAlmostEqual(depth.allowed_rate, 2.5)
+
+    def test_ready_paces_to_allowed_rate(self):
+        scheduler = VisionScheduler(cpu_budget=0.1)
+        faces = scheduler.register('faces', priority=1, rate=15, cost=0.02)
+        ran = sum(faces.ready(now=1000.0 + i / 30) for i in range(300))
+        # 0.1 cores / 20 ms = 5 Hz over 10 s
+        self.assertGreaterEqual(ran, 45)
+        self.assertLessEqual(ran, 55)
+        self.assertGreater(faces.skipped, 0)
+
+    def test_start_history_is_bounded(self):
+        scheduler = VisionScheduler()
+        task = scheduler.register('faces', priority=1, rate=15, cost=0.01)
+        for i in range(10000):
+            task.mark(now=1000.0 + i * 0.01)
+        now = 1000.0 + 9999 * 0.01
+        self.assertLessEqual(len(task.starts), RATE_WINDOW / 0.01 + 1)
+        self.assertAlmostEqual(task.achieved_rate(now=now), 100.0, delta=1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
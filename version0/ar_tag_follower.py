@@ -3,6 +3,14 @@ import numpy as np
 from flask import Flask, Response
 from gpiozero import Motor
 import threading
+import os
+import sys
+import time
+# Shared vision modules live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.frame_source import open_source
+from vision.aruco import ArucoTracker, MarkerKalman, estimate_pose, load_intrinsics
+from vision.buffers import BufferPool
 
 # Motor setup
 left_motor = Motor(forward=27, backward=17, enable=12)
@@ -12,15 +20,19 @@ right_motor = Motor(forward=22, backward=23, enable=13)
 DEAD_ZONE = 0.2
 MAX_SPEED = 1.0
 
-# ArUco dictionary setup (use a 4x4 dictionary for faster processing)
-aruco_dict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_50)
-parameters = cv2.aruco.DetectorParameters_create()
+# ArUco dictionary setup (use a 4x4 dictionary for faster processing).
+# Detection runs at DETECT_WIDTH and the corners are refined at full size.
+MARKER_ID = 0
+DETECT_WIDTH = 320
+FRAME_SIZE = (640, 480)
+MARKER_LENGTH = 0.1  # printed tag side in metres
+# Steering runs on the filtered pose at this rate, independent of detection
+CONTROL_RATE = 50
 
-app = Flask(__name__)
+# R2D2_CAMERA_CALIBRATION names a calibration file, else a nominal pinhole
+camera_matrix, dist_coeffs = load_intrinsics(size=FRAME_SIZE)
 
-# Global variables
-frame = None
-lock = threading.Lock()
+app = Flask(__name__)
 
 def apply_dead_zone(value, dead_zone):
     if abs(value) < dead_zone:
@@ -46,60 +58,118 @@ def stop():
     left_motor.stop()
     right_motor.stop()
 
-def process_frame(frame):
-    global aruco_dict, parameters
-
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    corners, ids, rejected = cv2.aruco.detectMarkers(gray, aruco_dict, parameters=parameters)
-
-    if ids is not None and 0 in ids:
-        cv2.aruco.drawDetectedMarkers(frame, corners, ids)
-
-        marker_center = np.mean(corners[0][0], axis=0)
-        frame_center = frame.shape[1] / 2
-        frame_bottom = frame.shape[0]
-
-        steering = (marker_center[0] - frame_center) / (frame_center / 2)
-        throttle = (frame_bottom - marker_center[1]) / (frame_bottom / 2)
-
-        steering = np.clip(steering, -1, 1) * MAX_SPEED
-        throttle = np.clip(throttle, -1, 1) * MAX_SPEED
-
-        control_motors(throttle, steering)
-
-        # Draw a box around the AR tag
-        cv2.polylines(frame, [np.int32(corners[0][0])], True, (0, 255, 0), 2)
-    else:
+class FollowThread(threading.Thread):
+    # Owns the camera and steers on every captured frame, whether or not
+    # anyone is watching. The stream only reads the annotated frames it
+    # publishes.
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.running = True
+        self.tracker = ArucoTracker(MARKER_ID, cv2.aruco.DICT_4X4_50, detect_width=DETECT_WIDTH)
+        self.filter = MarkerKalman()
+        self.pool = BufferPool()
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.fps = 0.0
+
+    def run(self):
+        cap = open_source()
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_SIZE[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_SIZE[1])
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        last = time.monotonic()
+        while self.running:
+            success, raw = cap.read()
+            if not success:
+                break
+            # Rotate the frame by 180 degrees, into a buffer the stream may still be reading
+            frame = self.pool.ring('annotated', raw.shape, 3)
+            cv2.rotate(raw, cv2.ROTATE_180, dst=frame)
+            gray = self.pool.get('gray', frame.shape[:2])
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+            self.process(frame, gray)
+            now = time.monotonic()
+            self.fps = 0.9 * self.fps + 0.1 / max(now - last, 1e-6)
+            last = now
+            with self.cond:
+                self.frame = frame
+                self.seq += 1
+                self.cond.notify_all()
+        cap.release()
         stop()
-        print("No AR tag detected")
 
-    return frame
+    def process(self, frame, gray):
+        corners = self.tracker.detect(gray)
+        if corners is not None:
+            rvec, tvec = estimate_pose(corners, MARKER_LENGTH, camera_matrix, dist_coeffs)
+            self.filter.correct(tvec)
+
+            # Draw a box around the AR tag
+            cv2.aruco.drawDetectedMarkers(frame, [corners.reshape(1, 4, 2)], np.array([[MARKER_ID]]))
+            cv2.polylines(frame, [np.int32(corners)], True, (0, 255, 0), 2)
+            cv2.drawFrameAxes(frame, camera_matrix, dist_coeffs, rvec, tvec, MARKER_LENGTH / 2)
+        # Where the filter puts the tag now, which is what the motors follow
+        position = self.filter.predict()
+        if position is not None and position[2] > 0:
+            cv2.drawMarker(frame, tuple(int(v) for v in project(position)), (0, 0, 255),
+                           cv2.MARKER_CROSS, 20, 2)
+        cv2.putText(frame, f"{self.fps:.0f} fps", (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+    def wait_next(self, last_seq, timeout=1.0):
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != last_seq or not self.running, timeout)
+            return self.seq, self.frame
+
+def project(position):
+    # Image point of a camera-frame position (pinhole, no distortion)
+    x, y, z = position
+    return (camera_matrix[0, 0] * x / z + camera_matrix[0, 2],
+            camera_matrix[1, 1] * y / z + camera_matrix[1, 2])
+
+follower = FollowThread()
+
+def control_loop():
+    # Steers at CONTROL_RATE from the Kalman prediction, so control is
+    # smooth between detections and coasts through short dropouts
+    lost = True
+    while follower.running:
+        position = follower.filter.predict()
+        if position is None or position[2] <= 0:
+            stop()
+            if not lost:
+                print("No AR tag detected")
+            lost = True
+        else:
+            lost = False
+            marker_x, marker_y = project(position)
+            frame_center = FRAME_SIZE[0] / 2
+            frame_bottom = FRAME_SIZE[1]
+
+            steering = (marker_x - frame_center) / (frame_center / 2)
+            throttle = (frame_bottom - marker_y) / (frame_bottom / 2)
+
+            steering = np.clip(steering, -1, 1) * MAX_SPEED
+            throttle = np.clip(throttle, -1, 1) * MAX_SPEED
+
+            control_motors(throttle, steering)
+        time.sleep(1.0 / CONTROL_RATE)
 
 def generate_frames():
-    global frame, lock
-
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-    while True:
-        success, frame = cap.read()
-        if not success:
-            break
-
-        # Rotate the frame by 180 degrees
-        frame = cv2.rotate(frame, cv2.ROTATE_180)
-
-        with lock:
-            frame = process_frame(frame)
-
+    # Passive viewer: encodes whatever the follow loop last annotated
+    last_seq = 0
+    while follower.running:
+        seq, frame = follower.wait_next(last_seq)
+        if seq == last_seq or frame is None:
+            continue
+        last_seq = seq
         ret, buffer = cv2.imencode('.jpg', frame)
+        if not ret:
+            continue
         frame_bytes = buffer.tobytes()
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
 
-    cap.release()
-
 @app.route('/video_feed')
 def video_feed():
     return Response(generate_frames(),
@@ -120,5 +190,10 @@ def index():
     """
 
 if __name__ == '__main__':
-    threading.Thread(target=lambda: app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)).start()
-    generate_frames()
+    follower.start()
+    threading.Thread(target=control_loop, daemon=True).start()
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, threaded=True)
+    finally:
+        follower.running = False
+        stop()
@@ -4,7 +4,12 @@ import time
 import cv2
 import numpy as np
 import os
+import sys
 import threading
+# Shared vision modules live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.frame_source import open_source
+from vision.face_detectors import create_detector
 from flask import Flask, Response, render_template_string, request
 import subprocess
 import random
@@ -18,14 +23,14 @@ SPEKTRUM_PRODUCT_ID = 0x572b
 DEAD_ZONE = 0.2  # 20% dead zone
 
 # Face Detection and Optical Flow Constants
-cascade_path = "/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml"
-if not os.path.isfile(cascade_path):
-    print(f"Error: Cascade file not found at {cascade_path}")
+# Haar cascade by default; R2D2_FACE_DETECTOR selects lbp, ssd or yunet
+try:
+    face_detector = create_detector()
+except (FileNotFoundError, ValueError) as e:
+    print(f"Error: {e}")
     exit()
 
-face_cascade = cv2.CascadeClassifier(cascade_path)
-
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
+camera = open_source()
 if not camera.isOpened():
     print("Error: Could not open camera.")
     exit()
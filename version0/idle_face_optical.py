@@ -1,22 +1,26 @@
 from flask import Flask, Response, render_template_string, request
 import cv2
-import numpy as np
 import time
 import os
+import sys
 from gpiozero import Motor
 import threading
+# Shared vision modules live at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vision.frame_source import open_source
+from vision.face_detectors import create_detector
+from vision.optical_flow import OpticalFlowTracker
 
 app = Flask(__name__)
 
-cascade_path = "/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml"
-
-if not os.path.isfile(cascade_path):
-    print(f"Error: Cascade file not found at {cascade_path}")
+# Haar cascade by default; R2D2_FACE_DETECTOR selects lbp, ssd or yunet
+try:
+    face_detector = create_detector()
+except (FileNotFoundError, ValueError) as e:
+    print(f"Error: {e}")
     exit()
 
-face_cascade = cv2.CascadeClassifier(cascade_path)
-
-camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
+camera = open_source()
 
 if not camera.isOpened():
     print("Error: Could not open camera.")
@@ -36,13 +40,8 @@ movement_command = None
 movement_start_time = 0
 
 # Parameters for optical flow
-feature_params = dict(maxCorners=100, qualityLevel=0.3, minDistance=7, blockSize=7)
-lk_params = dict(winSize=(15, 15), maxLevel=2, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
-color = np.random.randint(0, 255, (100, 3))
-
-# Global variables
-prev_frame = None
-prev_points = None
+# Up to 100 persistent tracks, topped up only in empty grid cells
+flow = OpticalFlowTracker(max_tracks=100)
 
 def motor_control():
     global current_angle, movement_command, movement_start_time
@@ -59,7 +58,6 @@ def motor_control():
         time.sleep(0.01)
 
 def generate_frames():
-    global prev_frame, prev_points
     while True:
         ret, frame = camera.read()
         if not ret:
@@ -69,7 +67,7 @@ def generate_frames():
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
         # Face detection
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        faces = face_detector.detect(gray)
         
         if len(faces) > 0:
             for (x, y, w, h) in faces:
@@ -82,29 +80,11 @@ def generate_frames():
                 cv2.drawMarker(frame, (x, y+h), (0, 255, 0), cv2.MARKER_CROSS, 10, 2)
                 cv2.drawMarker(frame, (x+w, y+h), (0, 255, 0), cv2.MARKER_CROSS, 10, 2)
             
-            prev_points = None  # Reset optical flow points when face is detected
+            flow.reset()  # Reset optical flow points when face is detected
         else:
             # Optical flow
-            if prev_frame is not None:
-                if prev_points is None:
-                    prev_points = cv2.goodFeaturesToTrack(prev_frame, mask=None, **feature_params)
-                
-                if prev_points is not None:
-                    next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_frame, gray, prev_points, None, **lk_params)
-                    
-                    if next_points is not None:
-                        good_new = next_points[status == 1]
-                        good_old = prev_points[status == 1]
-                        
-                        for i, (new, old) in enumerate(zip(good_new, good_old)):
-                            a, b = new.ravel()
-                            c, d = old.ravel()
-                            frame = cv2.line(frame, (int(a), int(b)), (int(c), int(d)), color[i].tolist(), 2)
-                            frame = cv2.circle(frame, (int(a), int(b)), 5, color[i].tolist(), -1)
-                    
-                    prev_points = good_new.reshape(-1, 1, 2)
-        
-        prev_frame = gray
+            flow.update(gray)
+            flow.draw(frame)
         
         # Display current movement command
         cv2.putText(frame, f"Movement: {movement_command if movement_command else 'None'}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.01)
+
+
+def make_detector(dictionary_id):
+    # detectMarkers(image) -> (corners, ids) for both the OpenCV >= 4.7
+    # ArucoDetector API and the older module-level functions
+    dictionary = cv2.aruco.getPredefinedDictionary(dictionary_id)
+    if hasattr(cv2.aruco, 'ArucoDetector'):
+        detector = cv2.aruco.ArucoDetector(dictionary, cv2.aruco.DetectorParameters())
+        return lambda image: detector.detectMarkers(image)[:2]
+    parameters = cv2.aruco.DetectorParameters_create()
+    return lambda image: cv2.aruco.detectMarkers(image, dictionary, parameters=parameters)[:2]
+
+
+class ArucoTracker:
+    # Finds one marker per frame and returns its four corners at full
+    # resolution. detectMarkers runs on a copy scaled down to detect_width;
+    # a hit is scaled back up and its corners refined with cornerSubPix in
+    # a full-resolution ROI around it. If the small image misses (a distant
+    # marker too small to decode) and the marker was seen within `memory`
+    # frames, detectMarkers runs on a full-resolution ROI around the last
+    # hit instead.
+    def __init__(self, marker_id=0, dictionary=cv2.aruco.DICT_4X4_50, detect_width=320,
+                 margin=0.5, memory=10):
+        self.marker_id = marker_id
+        self.detect_markers = make_detector(dictionary)
+        self.detect_width = detect_width
+        self.margin = margin
+        self.memory = memory
+        self.small = None
+        self.last = None
+        self.missed = 0
+        self.counts = {'small': 0, 'roi': 0, 'miss': 0}
+
+    def _find(self, image):
+        corners, ids = self.detect_markers(image)
+        if ids is None:
+            return None
+        hits = np.flatnonzero(ids.ravel() == self.marker_id)
+        if not len(hits):
+            return None
+        return corners[hits[0]].reshape(4, 2).astype(np.float32)
+
+    def _roi(self, corners, shape, margin):
+        x0, y0 = corners.min(axis=0)
+        x1, y1 = corners.max(axis=0)
+        pad = max(x1 - x0, y1 - y0) * margin + 8
+        h, w = shape[:2]
+        return (max(0, int(x0 - pad)), max(0, int(y0 - pad)),
+                min(w, int(x1 + pad) + 1), min(h, int(y1 + pad) + 1))
+
+    def _refine(self, gray, corners, window):
+        x0, y0, x1, y1 = self._roi(corners, gray.shape, 0.1)
+        local = np.ascontiguousarray((corners - (x0, y0)).reshape(4, 1, 2), np.float32)
+        cv2.cornerSubPix(gray[y0:y1, x0:x1], local, (window, window), (-1, -1), SUBPIX_CRITERIA)
+        return (local.reshape(4, 2) + (x0, y0)).astype(np.float32)
+
+    def detect(self, gray):
+        h, w = gray.shape[:2]
+        scale = w / self.detect_width if w > self.detect_width else 1.0
+        if scale > 1.0:
+            size = (self.detect_width, int(round(h / scale)))
+            if self.small is None or self.small.shape[::-1] != size:
+                self.small = np.empty(size[::-1], np.uint8)
+            cv2.resize(gray, size, dst=self.small, interpolation=cv2.INTER_AREA)
+            corners = self._find(self.small)
+        else:
+            corners = self._find(gray)
+        if corners is not None:
+            corners = self._refine(gray, corners * scale, max(3, int(round(2 * scale)) + 1))
+            self.counts['small'] += 1
+        elif self.last is not None and self.missed < self.memory:
+            x0, y0, x1, y1 = self._roi(self.last, gray.shape, self.margin)
+            corners = self._find(gray[y0:y1, x0:x1])
+            if corners is not None:
+                corners = self._refine(gray, corners + (x0, y0), 3)
+                self.counts['roi'] += 1
+        if corners is None:
+            self.counts['miss'] += 1
+            self.missed += 1
+        else:
+            self.last = corners
+            self.missed = 0
+        return corners
+
+    def stats(self):
+        return dict(self.counts)
+
+
+def load_intrinsics(path=None, size=(640, 480), hfov=62.2):
+    # Camera matrix and distortion from an OpenCV calibration file
+    # (camera_matrix / distortion_coefficients nodes, as written by the
+    # calibration samples) named by R2D2_CAMERA_CALIBRATION. Without one,
+    # a distortion-free pinhole with the Pi camera v2's horizontal FOV.
+    path = path or os.environ.get('R2D2_CAMERA_CALIBRATION')
+    if path:
+        fs = cv2.FileStorage(path, cv2.FILE_STORAGE_READ)
+        if not fs.isOpened():
+            raise FileNotFoundError(f"{path} not found")
+        camera_matrix = fs.getNode('camera_matrix').mat()
+        dist = fs.getNode('distortion_coefficients').mat()
+        fs.release()
+        return camera_matrix, dist if dist is not None else np.zeros(5)
+    w, h = size
+    f = (w / 2) / np.tan(np.radians(hfov) / 2)
+    camera_matrix = np.array([[f, 0, w / 2], [0, f, h / 2], [0, 0, 1]], np.float64)
+    return camera_matrix, np.zeros(5)
+
+
+def estimate_pose(corners, marker_length, camera_matrix, dist):
+    # (rvec, tvec) of one marker in camera coordinates, units of marker_length
+    if hasattr(cv2.aruco, 'estimatePoseSingleMarkers'):
+        rvecs, tvecs, _ = cv2.aruco.estimatePoseSingleMarkers(
+            [corners.reshape(1, 4, 2)], marker_length, camera_matrix, dist)
+        return rvecs[0, 0], tvecs[0, 0]
+    half = marker_length / 2
+    square = np.array([[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]],
+                      np.float32)
+    _, rvec, tvec = cv2.solvePnP(square, corners, camera_matrix, dist,
+                                 flags=cv2.SOLVEPNP_IPPE_SQUARE)
+    return rvec.ravel(), tvec.ravel()
+
+
+class MarkerKalman:
+    # Constant-velocity Kalman filter on the marker position (x, y, z in
+    # camera coordinates). correct() feeds a pose measurement whenever
+    # detection finds the marker; predict() can run at any rate in between
+    # and advances the state by the real elapsed time. Through a dropout
+    # the filter coasts on its velocity for up to max_coast seconds, after
+    # which predict() returns None until the marker is seen again.
+    def __init__(self, process_noise=0.5, measurement_noise=1e-4, max_coast=0.5):
+        self.kf = cv2.KalmanFilter(6, 3, 0, cv2.CV_64F)
+        self.kf.measurementMatrix = np.hstack([np.eye(3), np.zeros((3, 3))])
+        self.kf.measurementNoiseCov = np.eye(3) * measurement_noise
+        self.process_noise = process_noise
+        self.max_coast = max_coast
+        self.lock = threading.Lock()
+        self.initialized = False
+        self.state_time = 0.0
+        self.last_seen = 0.0
+        self.measurements = 0
+        self.predictions = 0
+
+    def _advance(self, now):
+        dt = max(0.0, now - self.state_time)
+        if dt > 0:
+            transition = np.eye(6)
+            transition[:3, 3:] = np.eye(3) * dt
+            self.kf.transitionMatrix = transition
+            # White-acceleration noise, scaled to the step
+            q = self.process_noise
+            noise = np.zeros((6, 6))
+            noise[:3, :3] = np.eye(3) * q * dt ** 3 / 3
+            noise[:3, 3:] = noise[3:, :3] = np.eye(3) * q * dt ** 2 / 2
+            noise[3:, 3:] = np.eye(3) * q * dt
+            self.kf.processNoiseCov = noise
+            self.kf.predict()
+            self.state_time = now
+
+    def correct(self, position, now=None):
+        now = time.monotonic() if now is None else now
+        position = np.asarray(position, np.float64).reshape(3, 1)
+        with self.lock:
+            if not self.initialized or now - self.last_seen > self.max_coast:
+                self.kf.statePost = np.vstack([position, np.zeros((3, 1))])
+                self.kf.errorCovPost = np.diag([1e-3] * 3 + [1.0] * 3)
+                self.initialized = True
+            else:
+                self._advance(now)
+                self.kf.correct(position)
+            self.state_time = now
+            self.last_seen = now
+            self.measurements += 1
+
+    def predict(self, now=None):
+        # Predicted (x, y, z) at `now`, or None when lost
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if not self.initialized or now - self.last_seen > self.max_coast:
+                return None
+            self._advance(now)
+            self.predictions += 1
+            return self.kf.statePost[:3, 0].copy()
+
+    def stats(self):
+        return {'measurements': self.measurements, 'predictions': self.predictions}
@@ -0,0 +1,247 @@
+import collections
+import itertools
+import threading
+import time
+
+import cv2
+
+from vision.tracing import tracer
+
+# (JPEG quality, scale, max fps), best first
+QUALITY_LEVELS = [
+    (85, 1.0, 30),
+    (75, 1.0, 20),
+    (65, 0.75, 15),
+    (55, 0.5, 10),
+    (45, 0.5, 5),
+]
+
+# EXIF APP1 segment with Orientation = 3 (rotate 180). Inserted after the
+# SOI marker of camera-native frames, so every passthrough frame says how
+# to display it and browsers rotate exactly those frames, on either stream.
+ROTATE_180_EXIF = (b'\xff\xe1\x00\x22Exif\x00\x00'
+                   b'MM\x00\x2a\x00\x00\x00\x08'
+                   b'\x00\x01\x01\x12\x00\x03\x00\x00\x00\x01\x00\x03\x00\x00'
+                   b'\x00\x00\x00\x00')
+
+
+def rotate_jpeg(jpeg):
+    # Marks an unrotated camera JPEG for 180 degree display
+    return bytes(jpeg[:2]) + ROTATE_180_EXIF + bytes(jpeg[2:])
+
+
+class AdaptiveQuality:
+    # Per-client controller. Watches how old each frame is by the time the
+    # client has drained it and walks QUALITY_LEVELS to hold target_latency:
+    # step down at once when the client falls behind, step back up only
+    # after a sustained run of fast deliveries.
+    def __init__(self, target_latency=0.2, upgrade_after=30):
+        self.target_latency = target_latency
+        self.upgrade_after = upgrade_after
+        self.level = 0
+        self.latency = 0.0
+        self.good = 0
+        self.last_sent = 0.0
+        self.last_change = 0.0
+
+    @property
+    def quality(self):
+        return QUALITY_LEVELS[self.level][0]
+
+    @property
+    def scale(self):
+        return QUALITY_LEVELS[self.level][1]
+
+    @property
+    def fps(self):
+        return QUALITY_LEVELS[self.level][2]
+
+    def allow(self, now):
+        # last_sent is the arrival time of the last frame sent, on the same
+        # clock as now; the slack keeps capture jitter from skipping a frame
+        # at the camera's own rate
+        return now - self.last_sent >= 0.8 / self.fps
+
+    def observe(self, latency, dropped):
+        now = time.time()
+        self.latency = 0.8 * self.latency + 0.2 * latency
+        if (self.latency > self.target_latency or dropped) and now - self.last_change > 1.0:
+            if self.level < len(QUALITY_LEVELS) - 1:
+                self.level += 1
+                self.last_change = now
+            self.good = 0
+        elif self.latency < self.target_latency / 2:
+            self.good += 1
+            if self.good >= self.upgrade_after and self.level > 0:
+                self.level -= 1
+                self.last_change = now
+                self.good = 0
+        else:
+            self.good = 0
+
+    def stats(self):
+        return {
+            'level': self.level,
+            'quality': self.quality,
+            'scale': self.scale,
+            'fps': self.fps,
+            'latency_ms': round(self.latency * 1000, 1),
+        }
+
+
+class StreamClient:
+    # Bounded drop-oldest queue of encoded frames for one viewer. A slow
+    # client only ever loses its own stale frames.
+    ids = itertools.count(1)
+
+    def __init__(self, queue_size=2):
+        self.id = next(self.ids)
+        self.frames = collections.deque(maxlen=queue_size)
+        self.event = threading.Event()
+        self.dropped = 0
+        self.controller = AdaptiveQuality()
+
+    def put(self, item, now=None):
+        # now is the time the frame was let through allow()
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(item)
+        self.controller.last_sent = time.time() if now is None else now
+        self.event.set()
+
+    def get(self, timeout=1.0):
+        if not self.event.wait(timeout):
+            return None
+        self.event.clear()
+        try:
+            return self.frames.popleft()
+        except IndexError:
+            return None
+        finally:
+            if self.frames:
+                self.event.set()
+
+    def stats(self):
+        stats = self.controller.stats()
+        stats['id'] = self.id
+        stats['dropped'] = self.dropped
+        return stats
+
+
+class MJPEGBroadcaster(threading.Thread):
+    # Renders each captured frame once and hands JPEG bytes to every
+    # connected /video_feed client. Clients on the same quality level share
+    # one encode. render(frame) returns the annotated BGR frame to encode.
+    # Nothing is encoded while nobody watches.
+    #
+    # If decoded_frames_needed is given and returns False (no overlay and no
+    # consumer of decoded frames is enabled), the camera is switched to
+    # raw mode and its MJPG bytes are forwarded untouched (no decode, flip or
+    # re-encode) to clients at full quality. Those frames carry an EXIF
+    # orientation tag, so the browser rotates them itself; see passthrough.
+    def __init__(self, capture, render, decoded_frames_needed=None, queue_size=2):
+        super().__init__(daemon=True)
+        self.capture = capture
+        self.render = render
+        self.decoded_frames_needed = decoded_frames_needed
+        self.queue_size = queue_size
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        self.sinks = []
+        self.running = True
+
+    def add_sink(self, sink):
+        # Extra consumers of rendered frames (e.g. the H.264 stream). A sink
+        # has an `active` flag and a push(seq, ts, frame) method that must
+        # copy the frame and return quickly.
+        self.sinks.append(sink)
+
+    def run(self):
+        last_seq = 0
+        while self.running:
+            sinks = [s for s in self.sinks if s.active]
+            if self.decoded_frames_needed is not None:
+                # Sinks need decoded frames, so they also rule out passthrough
+                self.capture.set_raw(not self.decoded_frames_needed() and not sinks)
+            seq, ts, frame, jpeg = self.capture.wait_packet(last_seq)
+            if seq == last_seq:
+                continue
+            last_seq = seq
+            now = time.time()
+            with self.clients_lock:
+                clients = [c for c in self.clients if c.controller.allow(now)]
+            if not clients and not sinks:
+                continue
+            if frame is not None:
+                with tracer.stage('overlay', seq):
+                    frame = self.render(frame)
+                for sink in sinks:
+                    sink.push(seq, ts, frame)
+            encoded = {}
+            for client in clients:
+                key = (client.controller.quality, client.controller.scale)
+                if key not in encoded:
+                    with tracer.stage('encode', seq):
+                        encoded[key] = self.encode(frame, jpeg, client.controller)
+                if encoded[key] is not None:
+                    client.put((seq, ts, encoded[key]), now)
+
+    def encode(self, frame, jpeg, controller):
+        flip = frame is None
+        if frame is None:
+            if jpeg is None:
+                return None
+            if controller.level == 0:
+                return rotate_jpeg(jpeg)
+            frame = cv2.imdecode(memoryview(jpeg), cv2.IMREAD_COLOR)
+            if frame is None:
+                return None
+        if controller.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=controller.scale, fy=controller.scale,
+                               interpolation=cv2.INTER_AREA)
+        if flip:
+            # Decoded from a camera-native frame, so not flipped by render yet
+            frame = cv2.flip(frame, -1)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, controller.quality])
+        return buffer.tobytes() if ret else None
+
+    @property
+    def passthrough(self):
+        return self.capture.raw
+
+    def stats(self):
+        with self.clients_lock:
+            return [c.stats() for c in self.clients]
+
+    def subscribe(self, queue_size=None):
+        client = StreamClient(queue_size or self.queue_size)
+        with self.clients_lock:
+            self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.clients_lock:
+            self.clients.discard(client)
+
+    def stream(self):
+        client = self.subscribe()
+        try:
+            while self.running:
+                item = client.get()
+                if item is None:
+                    continue
+                dropped = client.dropped
+                start = time.perf_counter()
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + item[2] + b'\r\n')
+                # The server asks for the next part only once this one is
+                # written, so the frame's age now is what the client sees
+                age = time.time() - item[1]
+                tracer.record('send', time.perf_counter() - start, item[0])
+                tracer.record('frame_age', age, item[0])
+                client.controller.observe(age, client.dropped != dropped)
+        finally:
+            self.unsubscribe(client)
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,93 @@
+import collections
+import os
+import threading
+import tracemalloc
+
+import numpy as np
+
+
+class BufferPool:
+    # Named, reusable frame buffers. A buffer is only allocated the first
+    # time a name is asked for, or when its shape changes. Every pool
+    # allocation is counted and mark_frame() is called once per frame, which
+    # lets stats() report pool allocations per frame over the last `window`
+    # frames.
+    #
+    # That only covers the pool. To see what the whole process allocates per
+    # frame (imencode, resize, tobytes, ...), set R2D2_TRACE_ALLOC=1 or pass
+    # trace=True: tracemalloc then runs, and each frame's peak traced heap
+    # above the level at the previous frame is reported as heap_kb_per_frame.
+    # That includes every thread and numpy array data. It is a lower bound,
+    # as a buffer freed before the next one is allocated shares the peak;
+    # an allocation-free steady state reads close to 0. tracemalloc slows
+    # every allocation, so leave it off on the robot.
+    def __init__(self, window=100, trace=None):
+        self.buffers = {}
+        self.rings = {}
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.frames = 0
+        self.history = collections.deque(maxlen=window)
+        if trace is None:
+            trace = os.environ.get('R2D2_TRACE_ALLOC') == '1'
+        self.trace = trace
+        self.heap_history = collections.deque(maxlen=window)
+        self.heap_level = 0
+        if trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.heap_level = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def _allocate(self, shape, dtype):
+        with self.lock:
+            self.allocations += 1
+        return np.empty(shape, dtype)
+
+    def get(self, name, shape, dtype=np.uint8, fill=None):
+        # fill initialises a newly allocated buffer, for constant images
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = self._allocate(shape, dtype)
+            if fill is not None:
+                buf[:] = fill
+            self.buffers[name] = buf
+        return buf
+
+    def ring(self, name, shape, size, dtype=np.uint8):
+        # Cycles through `size` buffers; a returned buffer is not handed out
+        # again for the next size - 1 calls
+        entry = self.rings.get(name)
+        if entry is None or entry[0][0].shape != shape or entry[0][0].dtype != dtype:
+            entry = ([self._allocate(shape, dtype) for _ in range(size)], 0)
+        bufs, index = entry
+        self.rings[name] = (bufs, (index + 1) % len(bufs))
+        return bufs[index]
+
+    def mark_frame(self):
+        with self.lock:
+            self.frames += 1
+            self.history.append(self.allocations)
+            if self.trace:
+                current, peak = tracemalloc.get_traced_memory()
+                self.heap_history.append(max(0, peak - self.heap_level))
+                self.heap_level = current
+                tracemalloc.reset_peak()
+
+    def stats(self):
+        with self.lock:
+            history = list(self.history)
+            heap = list(self.heap_history)
+            allocations = self.allocations
+            frames = self.frames
+        per_frame = 0.0
+        if len(history) > 1:
+            per_frame = (history[-1] - history[0]) / (len(history) - 1)
+        stats = {
+            'pool_allocations': allocations,
+            'frames': frames,
+            'pool_allocations_per_frame': per_frame,
+        }
+        if self.trace:
+            stats['heap_kb_per_frame'] = round(sum(heap) / len(heap) / 1024, 1) if heap else None
+        return stats
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import cv2
+
+from vision.tracing import tracer
+
+
+class CaptureThread(threading.Thread):
+    # Sole owner of the camera. Reads as fast as the device delivers so the
+    # driver buffer never fills with stale frames, and publishes only the
+    # newest frame tagged with a sequence number and capture time.
+    # Consumers must treat published frames as read-only.
+    #
+    # In raw mode the camera's own MJPG bytes are published as `jpeg` and
+    # `frame` is None, so nothing is decoded. The camera must have been
+    # opened with the MJPG FOURCC for this to work; if the driver still
+    # hands back decoded frames, raw mode quietly stays off.
+    #
+    # With a BufferPool, decoded frames are read into a ring of ring_size
+    # reused buffers. A published frame then stays valid for ring_size - 1
+    # further frames; consumers that need it longer must copy it.
+    def __init__(self, camera, pool=None, ring_size=4):
+        super().__init__(daemon=True)
+        self.camera = camera
+        self.pool = pool
+        self.ring_size = ring_size
+        self.shape = None
+        self.running = True
+        self.cond = threading.Condition()
+        self.frame = None
+        self.jpeg = None
+        self.seq = 0
+        self.timestamp = 0.0
+        self.raw = False
+        self.want_raw = False
+        self.raw_supported = True
+
+    def set_raw(self, raw):
+        # Applied by the capture thread itself, which owns the device
+        self.want_raw = raw and self.raw_supported
+
+    def _apply_mode(self):
+        self.camera.set(cv2.CAP_PROP_CONVERT_RGB, 0 if self.want_raw else 1)
+        self.raw = self.want_raw
+
+    def run(self):
+        while self.running:
+            if self.want_raw != self.raw:
+                self._apply_mode()
+            start = time.perf_counter()
+            if self.pool is not None and self.shape is not None and not self.raw:
+                ret, frame = self.camera.read(self.pool.ring('capture', self.shape, self.ring_size))
+            else:
+                ret, frame = self.camera.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            tracer.record('capture', time.perf_counter() - start, self.seq + 1)
+            if frame.ndim == 3:
+                self.shape = frame.shape
+            now = time.time()
+            jpeg = None
+            if self.raw:
+                if frame.ndim == 2 and frame.shape[0] == 1:
+                    jpeg = frame.tobytes()
+                    frame = None
+                else:
+                    # Driver ignored CONVERT_RGB=0; stay in decode mode
+                    self.raw_supported = False
+                    self.want_raw = False
+                    self._apply_mode()
+            with self.cond:
+                self.frame = frame
+                self.jpeg = jpeg
+                self.seq += 1
+                self.timestamp = now
+                self.cond.notify_all()
+            if self.pool is not None:
+                self.pool.mark_frame()
+
+    def latest(self):
+        with self.cond:
+            return self.seq, self.timestamp, self.frame
+
+    def wait_packet(self, last_seq, timeout=1.0):
+        # Like wait_next, but also returns the camera's JPEG bytes (raw mode)
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != last_seq or not self.running, timeout)
+            return self.seq, self.timestamp, self.frame, self.jpeg
+
+    def wait_next(self, last_seq, timeout=1.0):
+        # Block until a frame newer than last_seq is available. Consumers that
+        # fall behind skip straight to the newest frame instead of queueing.
+        # frame is None while the camera is in raw mode.
+        return self.wait_packet(last_seq, timeout)[:3]
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
@@ -0,0 +1,152 @@
+import os
+
+import cv2
+import numpy as np
+
+from vision.depth_scheduler import DEPTH_RESOLUTIONS
+from vision.face_detectors import MODEL_DIR
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Default int8 model for the onnx backend, looked up in MODEL_DIR
+ONNX_MODEL = 'monodepth2_mono_640x192_int8.onnx'
+
+
+class DepthBackend:
+    # eval(image) takes a BGR image and returns a 2D float32 disparity map
+    # (larger is nearer). resolutions lists the (w, h) input sizes the
+    # backend can run at, largest first, for the DepthScheduler.
+    name = None
+    resolutions = DEPTH_RESOLUTIONS
+
+    def eval(self, image):
+        raise NotImplementedError
+
+
+def disp_to_depth(disp, min_depth=0.1, max_depth=100.0):
+    # Monodepth2's mapping from a backend's normalised disparity to depth,
+    # shared by auto-braking and the depth benchmark
+    min_disp = 1.0 / max_depth
+    max_disp = 1.0 / min_depth
+    return 1.0 / (min_disp + (max_disp - min_disp) * np.clip(disp, 0.0, 1.0))
+
+
+class Monodepth2Backend(DepthBackend):
+    # The full-precision PyTorch model
+    name = 'monodepth2'
+
+    def __init__(self):
+        import monodepth2
+        self.md = monodepth2.monodepth2()
+
+    def eval(self, image):
+        return self.md.eval(image)
+
+
+class OnnxDepthBackend(DepthBackend):
+    # An exported (and usually int8-quantized) Monodepth2 encoder+decoder
+    # run through ONNX Runtime on CPU. The model takes a 1x3xHxW RGB tensor
+    # in [0, 1] and returns 1x1xHxW disparity. Input and output tensors are
+    # allocated once and bound with IOBinding, so eval() does no
+    # allocations beyond what the runtime does internally.
+    name = 'onnx'
+
+    def __init__(self, model=None, threads=None):
+        if ort is None:
+            raise ImportError("onnxruntime is not installed (pip install onnxruntime)")
+        path = model or os.path.join(MODEL_DIR, ONNX_MODEL)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"{path} not found")
+        threads = threads or int(os.environ.get('R2D2_DEPTH_THREADS', '2'))
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.threads = threads
+
+        model_input = self.session.get_inputs()[0]
+        model_output = self.session.get_outputs()[0]
+        _, _, h, w = model_input.shape
+        if not isinstance(h, int) or not isinstance(w, int):
+            # Dynamic axes: start at the largest size, reallocate on demand
+            w, h = DEPTH_RESOLUTIONS[0]
+        else:
+            self.resolutions = [(w, h)]
+        self.input_name = model_input.name
+        self.output_name = model_output.name
+        self.binding = self.session.io_binding()
+        self._allocate(w, h)
+
+    def _allocate(self, w, h):
+        self.size = (w, h)
+        self.resized = np.empty((h, w, 3), np.uint8)
+        self.tensor = np.empty((1, 3, h, w), np.float32)
+        self.output = np.empty((1, 1, h, w), np.float32)
+        self.binding.bind_input(self.input_name, 'cpu', 0, np.float32,
+                                self.tensor.shape, self.tensor.ctypes.data)
+        self.binding.bind_output(self.output_name, 'cpu', 0, np.float32,
+                                 self.output.shape, self.output.ctypes.data)
+
+    def eval(self, image):
+        h, w = image.shape[:2]
+        if (w, h) != self.size:
+            if len(self.resolutions) > 1 and (w, h) in self.resolutions:
+                self._allocate(w, h)
+            else:
+                cv2.resize(image, self.size, dst=self.resized, interpolation=cv2.INTER_AREA)
+                image = self.resized
+        # BGR HWC uint8 -> RGB CHW float in [0, 1], straight into the bound tensor
+        np.multiply(image[:, :, ::-1].transpose(2, 0, 1), 1.0 / 255, out=self.tensor[0],
+                    casting='unsafe')
+        self.session.run_with_iobinding(self.binding)
+        return self.output[0, 0]
+
+
+def quantize_model(fp32_path, int8_path, frames):
+    # Static int8 quantization (QDQ, per-channel weights) calibrated on
+    # recorded BGR frames, which is what makes convolutions faster on ARM
+    from onnxruntime import quantization
+
+    session = ort.InferenceSession(fp32_path, providers=['CPUExecutionProvider'])
+    model_input = session.get_inputs()[0]
+    _, _, h, w = model_input.shape
+    if not isinstance(h, int) or not isinstance(w, int):
+        w, h = DEPTH_RESOLUTIONS[0]
+
+    class Reader(quantization.CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            if frame is None:
+                return None
+            rgb = cv2.cvtColor(cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA),
+                               cv2.COLOR_BGR2RGB)
+            tensor = rgb.transpose(2, 0, 1)[np.newaxis].astype(np.float32) / 255
+            return {model_input.name: tensor}
+
+    quantization.quantize_static(fp32_path, int8_path, Reader(),
+                                 quant_format=quantization.QuantFormat.QDQ,
+                                 per_channel=True,
+                                 activation_type=quantization.QuantType.QUInt8,
+                                 weight_type=quantization.QuantType.QInt8)
+
+
+BACKENDS = {
+    'monodepth2': Monodepth2Backend,
+    'onnx': OnnxDepthBackend,
+}
+
+
+def create_depth_backend(name=None, **kwargs):
+    # Backend from R2D2_DEPTH_BACKEND when no name is given (default 'monodepth2')
+    name = name or os.environ.get('R2D2_DEPTH_BACKEND', 'monodepth2')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown depth backend '{name}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
@@ -0,0 +1,57 @@
+import threading
+
+import cv2
+import numpy as np
+
+from vision.tracing import tracer
+
+
+class DepthOverlayCache:
+    # Holds the colourised depth overlay at display resolution, so it is
+    # only rebuilt when a new depth map arrives instead of on every
+    # streamed frame. update() runs on the depth thread: it min-max scales
+    # the depth map to 8 bits with one convertScaleAbs and colourises it
+    # through a 256-entry colormap table computed once. display() runs on
+    # the render thread and resizes that to the frame size only when the
+    # version has moved on; every viewer shares the result.
+    def __init__(self, colormap=cv2.COLORMAP_JET):
+        ramp = np.arange(256, dtype=np.uint8).reshape(256, 1)
+        self.lut = cv2.applyColorMap(ramp, colormap).reshape(256, 3)
+        self.lock = threading.Lock()
+        self.norm = None
+        self.color = None
+        self.version = 0
+        self.shown = None
+        self.shown_version = 0
+        self.rebuilds = 0
+
+    def update(self, depth):
+        if depth.ndim == 3:
+            depth = depth[:, :, 0]
+        lo, hi, _, _ = cv2.minMaxLoc(depth)
+        scale = 255.0 / (hi - lo) if hi > lo else 0.0
+        with self.lock:
+            if self.norm is None or self.norm.shape != depth.shape:
+                self.norm = np.empty(depth.shape, np.uint8)
+                self.color = np.empty(depth.shape + (3,), np.uint8)
+            cv2.convertScaleAbs(depth, self.norm, scale, -lo * scale)
+            np.take(self.lut, self.norm, axis=0, out=self.color)
+            self.version += 1
+
+    def display(self, shape):
+        # Returns (overlay, version) at shape[:2], or (None, version)
+        with self.lock:
+            if self.color is None:
+                return None, self.version
+            if (self.shown is None or self.shown.shape[:2] != shape[:2]
+                    or self.shown_version != self.version):
+                if self.shown is None or self.shown.shape[:2] != shape[:2]:
+                    self.shown = np.empty((shape[0], shape[1], 3), np.uint8)
+                with tracer.stage('depth_overlay', self.version):
+                    cv2.resize(self.color, (shape[1], shape[0]), dst=self.shown)
+                self.shown_version = self.version
+                self.rebuilds += 1
+            return self.shown, self.version
+
+    def stats(self):
+        return {'version': self.version, 'rebuilds': self.rebuilds}
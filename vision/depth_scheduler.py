@@ -0,0 +1,98 @@
+import time
+
+import cv2
+import numpy as np
+
+# Monodepth2 input sizes (multiples of 32), largest first
+DEPTH_RESOLUTIONS = [(640, 192), (512, 160), (416, 128), (320, 96)]
+
+
+class DepthScheduler:
+    # Decides when depth inference runs and at what input size.
+    #
+    # cpu_budget is the share of one core depth may use (0.5 = half a core).
+    # The measured cost of each input size gives the rate the budget allows;
+    # the largest size that reaches the target rate is used, and the rate
+    # is capped there. While driving the target rate and budget go up. With
+    # the robot still and the scene unchanged (mean absolute difference of a
+    # small grayscale thumbnail under change_threshold), inference drops to
+    # idle_rate. However small the budget, depth still runs at min_rate so
+    # obstacle sectors never go stale.
+    def __init__(self, cpu_budget=0.5, resolutions=DEPTH_RESOLUTIONS, target_rate=5.0,
+                 driving_rate=10.0, driving_boost=1.5, idle_rate=0.5, change_threshold=4.0,
+                 min_rate=0.5):
+        self.cpu_budget = cpu_budget
+        self.resolutions = resolutions
+        self.target_rate = target_rate
+        self.driving_rate = driving_rate
+        self.driving_boost = driving_boost
+        self.idle_rate = idle_rate
+        self.change_threshold = change_threshold
+        self.min_rate = min_rate
+        self.costs = {r: None for r in resolutions}
+        self.reference = None
+        self.last_run = 0.0
+        self.last_change = 0.0
+        self.runs = 0
+        self.skipped_static = 0
+
+    def _targets(self, driving):
+        if driving:
+            return self.driving_rate, self.cpu_budget * self.driving_boost
+        return self.target_rate, self.cpu_budget
+
+    def resolution(self, driving):
+        rate, budget = self._targets(driving)
+        # Unmeasured sizes get tried, largest first
+        for r in self.resolutions:
+            cost = self.costs[r]
+            if cost is None or cost * rate <= budget:
+                return r
+        return self.resolutions[-1]
+
+    def rate(self, resolution, driving):
+        rate, budget = self._targets(driving)
+        cost = self.costs[resolution]
+        if cost:
+            rate = min(rate, max(budget, 0.0) / cost)
+        return max(rate, self.min_rate)
+
+    def change(self, gray):
+        thumb = gray[::4, ::4]
+        if self.reference is None or self.reference.shape != thumb.shape:
+            return float('inf')
+        return float(cv2.absdiff(thumb, self.reference).mean())
+
+    def should_run(self, gray, driving, now=None):
+        # Returns the input size to run at, or None to skip this frame
+        now = time.monotonic() if now is None else now
+        resolution = self.resolution(driving)
+        since = now - self.last_run
+        rate = self.rate(resolution, driving)
+        if rate <= 0 or since < 1.0 / rate:
+            return None
+        self.last_change = self.change(gray)
+        if not driving and self.last_change < self.change_threshold and since < 1.0 / self.idle_rate:
+            self.skipped_static += 1
+            return None
+        return resolution
+
+    def record(self, resolution, seconds, gray, now=None):
+        previous = self.costs[resolution]
+        self.costs[resolution] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+        self.last_run = time.monotonic() if now is None else now
+        self.runs += 1
+        thumb = gray[::4, ::4]
+        if self.reference is None or self.reference.shape != thumb.shape:
+            self.reference = np.empty_like(thumb)
+        np.copyto(self.reference, thumb)
+
+    def stats(self):
+        return {
+            'cpu_budget': self.cpu_budget,
+            'runs': self.runs,
+            'skipped_static': self.skipped_static,
+            'last_change': None if self.last_change == float('inf') else round(self.last_change, 2),
+            'costs_ms': {f'{w}x{h}': round(c * 1000, 1)
+                         for (w, h), c in self.costs.items() if c is not None},
+        }
@@ -0,0 +1,129 @@
+import os
+
+import cv2
+import numpy as np
+
+# Local model files for the DNN backends; override with R2D2_MODEL_DIR
+MODEL_DIR = os.environ.get('R2D2_MODEL_DIR', os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models')))
+
+CASCADE_DIRS = [
+    '/usr/share/opencv4/haarcascades',
+    '/usr/share/opencv4/lbpcascades',
+    cv2.data.haarcascades if hasattr(cv2, 'data') else '',
+]
+
+
+def _find(name, dirs):
+    for directory in dirs:
+        path = os.path.join(directory, name)
+        if directory and os.path.isfile(path):
+            return path
+    raise FileNotFoundError(f"{name} not found in {', '.join(d for d in dirs if d)}")
+
+
+def _to_gray(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _to_bgr(image):
+    return image if image.ndim == 3 else cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+def _filter_size(boxes, min_size, max_size):
+    return [b for b in boxes
+            if (min_size is None or (b[2] >= min_size[0] and b[3] >= min_size[1]))
+            and (max_size is None or (b[2] <= max_size[0] and b[3] <= max_size[1]))]
+
+
+class FaceDetector:
+    # detect(image) takes a BGR or grayscale image and returns (x, y, w, h)
+    # boxes. min_size/max_size bound the face size in pixels, which lets
+    # RoiFaceDetector bracket the search around a known face.
+    name = None
+
+    def detect(self, image, min_size=None, max_size=None):
+        raise NotImplementedError
+
+
+class CascadeDetector(FaceDetector):
+    def __init__(self, filename, name, scale_factor=1.1, min_neighbors=5, min_size=(30, 30)):
+        self.name = name
+        self.cascade = cv2.CascadeClassifier(_find(filename, CASCADE_DIRS))
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect(self, image, min_size=None, max_size=None):
+        kwargs = {}
+        if max_size is not None:
+            kwargs['maxSize'] = max_size
+        faces = self.cascade.detectMultiScale(_to_gray(image), scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors,
+                                              minSize=min_size or self.min_size, **kwargs)
+        return [tuple(int(v) for v in box) for box in faces]
+
+
+class SsdDetector(FaceDetector):
+    # OpenCV's res10 300x300 ResNet-SSD face detector (Caffe)
+    name = 'ssd'
+
+    def __init__(self, confidence=0.5, input_size=(300, 300)):
+        self.net = cv2.dnn.readNetFromCaffe(
+            _find('deploy.prototxt', [MODEL_DIR]),
+            _find('res10_300x300_ssd_iter_140000.caffemodel', [MODEL_DIR]))
+        self.confidence = confidence
+        self.input_size = input_size
+
+    def detect(self, image, min_size=None, max_size=None):
+        image = _to_bgr(image)
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, self.input_size, (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = []
+        for x0, y0, x1, y1 in detections[:, 3:7] * np.array([w, h, w, h]):
+            x0, y0 = max(0, int(x0)), max(0, int(y0))
+            x1, y1 = min(w, int(x1)), min(h, int(y1))
+            if x1 > x0 and y1 > y0:
+                boxes.append((x0, y0, x1 - x0, y1 - y0))
+        return _filter_size(boxes, min_size, max_size)
+
+
+class YuNetDetector(FaceDetector):
+    # YuNet via cv2.FaceDetectorYN (OpenCV >= 4.5.4)
+    name = 'yunet'
+
+    def __init__(self, confidence=0.6, filename='face_detection_yunet_2023mar.onnx'):
+        self.net = cv2.FaceDetectorYN.create(_find(filename, [MODEL_DIR]), '', (320, 320), confidence)
+        self.input_size = None
+
+    def detect(self, image, min_size=None, max_size=None):
+        image = _to_bgr(image)
+        size = (image.shape[1], image.shape[0])
+        if size != self.input_size:
+            self.net.setInputSize(size)
+            self.input_size = size
+        _, faces = self.net.detect(image)
+        if faces is None:
+            return []
+        boxes = [tuple(int(v) for v in face[:4]) for face in faces]
+        return _filter_size(boxes, min_size, max_size)
+
+
+BACKENDS = {
+    'haar': lambda **kw: CascadeDetector('haarcascade_frontalface_default.xml', 'haar', **kw),
+    'lbp': lambda **kw: CascadeDetector('lbpcascade_frontalface_improved.xml', 'lbp', **kw),
+    'ssd': SsdDetector,
+    'yunet': YuNetDetector,
+}
+
+
+def create_detector(name=None, **kwargs):
+    # Backend from R2D2_FACE_DETECTOR when no name is given (default 'haar').
+    # Raises FileNotFoundError if the cascade or model file is missing.
+    name = name or os.environ.get('R2D2_FACE_DETECTOR', 'haar')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown face detector '{name}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
@@ -0,0 +1,196 @@
+import cv2
+import numpy as np
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class TrackedFace:
+    def __init__(self, box, points):
+        self.box = tuple(float(v) for v in box)
+        self.points = points
+        self.confidence = 1.0
+
+
+class FaceTracker:
+    # Detect-then-track. detect(gray) runs the full detector on keyframes;
+    # in between, each face is followed with LK optical flow on corners
+    # inside its box, moved by the median flow and scaled by the median
+    # change in spread. Points that fail a forward-backward check are
+    # dropped, and when too few survive the next frame is a keyframe.
+    # detect may return None to mean "still working" (see AsyncDetector);
+    # tracking then carries on and detect is polled again next frame. If
+    # detect has a `source` frame, its boxes are taken to belong to that
+    # frame: corners are seeded there and tracked forward to this one.
+    def __init__(self, detect, keyframe_interval=10, max_corners=30, min_points=5,
+                 min_confidence=0.5, fb_threshold=1.0):
+        self.detect = detect
+        self.keyframe_interval = keyframe_interval
+        self.max_corners = max_corners
+        self.min_points = min_points
+        self.min_confidence = min_confidence
+        self.fb_threshold = fb_threshold
+        self.faces = []
+        self.prev = None
+        self.mask = None
+        self.since_keyframe = 0
+        self.redetect = True
+        self.frames = 0
+        self.detections = 0
+
+    def update(self, gray):
+        self.frames += 1
+        if self.prev is None or self.prev.shape != gray.shape:
+            self.prev = np.empty_like(gray)
+            self.mask = np.zeros_like(gray)
+            self.faces = []
+            self.redetect = True
+        boxes = None
+        if self.redetect or self.since_keyframe >= self.keyframe_interval:
+            boxes = self.detect(gray)
+        if boxes is not None:
+            self.detections += 1
+            source = getattr(self.detect, 'source', None)
+            if source is None or source.shape != gray.shape:
+                source = gray
+            self.faces = [self._seed(source, box) for box in boxes]
+            self.since_keyframe = 0
+            self.redetect = False
+            if source is not gray:
+                # Catch up on the frames that went by while detection ran
+                self._track(source, gray)
+        else:
+            self.since_keyframe += 1
+            self._track(self.prev, gray)
+        # Frames come from shared buffers, so keep our own copy
+        np.copyto(self.prev, gray)
+        return self.boxes()
+
+    def boxes(self):
+        return [tuple(int(round(v)) for v in face.box) for face in self.faces]
+
+    def _seed(self, gray, box):
+        x, y, w, h = [int(v) for v in box]
+        # Corners from the middle of the box stay on the face, not the background
+        self.mask[:] = 0
+        self.mask[y + h // 6:y + h - h // 6, x + w // 6:x + w - w // 6] = 255
+        points = cv2.goodFeaturesToTrack(gray, maxCorners=self.max_corners, qualityLevel=0.01,
+                                         minDistance=3, mask=self.mask)
+        if points is None or len(points) < self.min_points:
+            # Nothing to track; keep the box until the next keyframe
+            return TrackedFace(box, None)
+        return TrackedFace(box, points)
+
+    def _track(self, prev, gray):
+        kept = []
+        for face in self.faces:
+            if face.points is None:
+                kept.append(face)
+                continue
+            p0 = face.points
+            p1, st1, _ = cv2.calcOpticalFlowPyrLK(prev, gray, p0, None, **LK_PARAMS)
+            p0r, st2, _ = cv2.calcOpticalFlowPyrLK(gray, prev, p1, None, **LK_PARAMS)
+            fb = np.abs(p0 - p0r).reshape(-1, 2).max(axis=1)
+            good = (st1.ravel() == 1) & (st2.ravel() == 1) & (fb < self.fb_threshold)
+            face.confidence = good.sum() / len(p0)
+            if good.sum() < self.min_points or face.confidence < self.min_confidence:
+                # Lost: show the last box this frame and re-detect on the next
+                self.redetect = True
+                kept.append(face)
+                continue
+            old = p0[good].reshape(-1, 2)
+            new = p1[good].reshape(-1, 2)
+            dx, dy = np.median(new - old, axis=0)
+            spread_old = np.linalg.norm(old - old.mean(axis=0), axis=1)
+            spread_new = np.linalg.norm(new - new.mean(axis=0), axis=1)
+            valid = spread_old > 1e-3
+            scale = float(np.median(spread_new[valid] / spread_old[valid])) if valid.any() else 1.0
+            x, y, w, h = face.box
+            cx, cy = x + w / 2 + dx, y + h / 2 + dy
+            w, h = w * scale, h * scale
+            face.box = (cx - w / 2, cy - h / 2, w, h)
+            face.points = new.reshape(-1, 1, 2)
+            kept.append(face)
+        self.faces = kept
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'detections': self.detections,
+            'faces': len(self.faces),
+        }
+
+
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+class RoiFaceDetector:
+    # Wraps a vision.face_detectors backend. Once faces are known, only
+    # searches enlarged regions around the previous boxes, with the face
+    # size bracketed around the previous one. A full-frame scan runs every
+    # full_scan_interval frames (to pick up new faces) and on the frame
+    # after a face is lost.
+    def __init__(self, detector, full_scan_interval=15, margin=0.5, scale_range=(0.7, 1.4),
+                 min_size=(30, 30)):
+        self.detector = detector
+        self.full_scan_interval = full_scan_interval
+        self.margin = margin
+        self.scale_range = scale_range
+        self.min_size = min_size
+        self.boxes = []
+        self.since_full = 0
+        self.lost = False
+        self.frames = 0
+        self.full_scans = 0
+        self.pixels = 0
+        self.full_pixels = 0
+
+    def detect(self, gray):
+        self.frames += 1
+        self.full_pixels += gray.shape[0] * gray.shape[1]
+        if not self.boxes or self.lost or self.since_full >= self.full_scan_interval:
+            self.full_scans += 1
+            self.since_full = 0
+            self.lost = False
+            self.pixels += gray.shape[0] * gray.shape[1]
+            self.boxes = self.detector.detect(gray, min_size=self.min_size)
+            return self.boxes
+        self.since_full += 1
+        frame_h, frame_w = gray.shape[:2]
+        found = []
+        for (x, y, w, h) in self.boxes:
+            mx, my = int(w * self.margin), int(h * self.margin)
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            x1, y1 = min(frame_w, x + w + mx), min(frame_h, y + h + my)
+            self.pixels += (x1 - x0) * (y1 - y0)
+            size = min(w, h)
+            min_side = max(self.min_size[0], int(size * self.scale_range[0]))
+            max_side = int(max(w, h) * self.scale_range[1])
+            hits = self.detector.detect(gray[y0:y1, x0:x1], min_size=(min_side, min_side),
+                                        max_size=(max_side, max_side))
+            if len(hits) == 0:
+                self.lost = True
+                continue
+            # Keep the hit closest in size to the face we were following
+            hx, hy, hw, hh = min(hits, key=lambda b: abs(int(b[2]) - w))
+            box = (int(hx) + x0, int(hy) + y0, int(hw), int(hh))
+            if all(box_iou(box, other) < 0.5 for other in found):
+                found.append(box)
+        self.boxes = found
+        return found
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'full_scans': self.full_scans,
+            'faces': len(self.boxes),
+            # Fraction of full-frame pixels actually searched
+            'pixel_ratio': round(self.pixels / self.full_pixels, 3) if self.full_pixels else 0.0,
+        }
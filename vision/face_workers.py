@@ -0,0 +1,183 @@
+import collections
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from vision.face_detectors import create_detector
+from vision.face_tracking import RoiFaceDetector
+from vision.tracing import tracer
+
+
+def _worker(index, shm, slots, max_shape, tasks, results, backend, roi):
+    detector = create_detector(backend)
+    if roi:
+        detector = RoiFaceDetector(detector)
+    frames = np.ndarray((slots,) + max_shape, np.uint8, buffer=shm.buf)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        slot, seq, h, w, min_size = task
+        start = time.perf_counter()
+        image = frames[slot, :h, :w]
+        if roi:
+            boxes = detector.detect(image)
+            # RoiFaceDetector state lives here; send its counters back too
+            detector_stats = detector.stats()
+        else:
+            boxes = detector.detect(image, min_size=min_size)
+            detector_stats = None
+        results.put((slot, seq, boxes, time.perf_counter() - start, index, detector_stats))
+
+
+class FaceWorkerPool:
+    # Face detection in separate processes, off the GIL. Grayscale frames
+    # are copied into slots of one shared-memory block; only (slot, seq,
+    # size) goes through the task queue and only boxes come back. submit()
+    # never blocks: with every slot busy the frame is simply skipped.
+    #
+    # Workers are forked so they don't re-import the control script, which
+    # opens the camera and GPIO at module level. Create the pool before
+    # starting any threads. With roi=True each worker keeps its own
+    # RoiFaceDetector state, so use a single worker.
+    def __init__(self, workers=2, backend=None, max_shape=(720, 1280), roi=False):
+        # Fail here, in the parent, if the backend's model files are missing
+        create_detector(backend)
+        ctx = mp.get_context('fork')
+        self.max_shape = tuple(max_shape)
+        self.slots = workers * 2
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * max_shape[0] * max_shape[1])
+        self.frames = np.ndarray((self.slots,) + self.max_shape, np.uint8, buffer=self.shm.buf)
+        self.free = collections.deque(range(self.slots))
+        self.lock = threading.Lock()
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.seq = 0
+        self.latest_seq = 0
+        self.latest_boxes = []
+        self.recent = collections.OrderedDict()
+        self.submitted = 0
+        self.skipped = 0
+        self.completed = 0
+        self.detector_stats = [None] * workers
+        self.running = True
+        self.procs = [ctx.Process(target=_worker, daemon=True,
+                                  args=(i, self.shm, self.slots, self.max_shape, self.tasks,
+                                        self.results, backend, roi))
+                      for i in range(workers)]
+        for proc in self.procs:
+            proc.start()
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    def submit(self, gray, seq=None, min_size=None):
+        # Returns the sequence number the boxes will be tagged with, or None
+        # if the frame was skipped
+        h, w = gray.shape[:2]
+        if h > self.max_shape[0] or w > self.max_shape[1]:
+            raise ValueError(f"frame {w}x{h} larger than pool slots")
+        with self.lock:
+            if seq is None:
+                self.seq += 1
+                seq = self.seq
+            if not self.free:
+                self.skipped += 1
+                return None
+            slot = self.free.popleft()
+            self.submitted += 1
+        np.copyto(self.frames[slot, :h, :w], gray)
+        self.tasks.put((slot, seq, h, w, min_size))
+        return seq
+
+    def _collect(self):
+        while self.running:
+            try:
+                slot, seq, boxes, elapsed, worker, detector_stats = self.results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            tracer.record('detect', elapsed, seq)
+            with self.lock:
+                self.free.append(slot)
+                self.completed += 1
+                if detector_stats is not None:
+                    self.detector_stats[worker] = detector_stats
+                self.recent[seq] = boxes
+                while len(self.recent) > 32:
+                    self.recent.popitem(last=False)
+                # Workers can finish out of order; never go back in time
+                if seq > self.latest_seq:
+                    self.latest_seq = seq
+                    self.latest_boxes = boxes
+
+    def latest(self):
+        with self.lock:
+            return self.latest_seq, self.latest_boxes
+
+    def result(self, seq):
+        # Boxes for one submitted frame, or None if not finished yet
+        with self.lock:
+            return self.recent.get(seq)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': len(self.procs),
+                'submitted': self.submitted,
+                'skipped': self.skipped,
+                'completed': self.completed,
+                'in_flight': self.slots - len(self.free),
+                'latest_seq': self.latest_seq,
+                # Per-worker RoiFaceDetector counters (full_scans, pixel_ratio), roi=True only
+                'detectors': [s for s in self.detector_stats if s is not None],
+            }
+
+    def close(self):
+        self.running = False
+        for _ in self.procs:
+            self.tasks.put(None)
+        for proc in self.procs:
+            proc.join(timeout=1.0)
+            if proc.is_alive():
+                proc.terminate()
+        self.frames = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class AsyncDetector:
+    # FaceTracker detect callable backed by a FaceWorkerPool. Returns None
+    # while a detection is in flight, then the boxes once they arrive.
+    # The boxes belong to an earlier frame than the one passed in, so a
+    # copy of the submitted frame is kept in `source` for FaceTracker to
+    # seed from and track forward.
+    def __init__(self, pool, min_size=None, timeout=1.0):
+        self.pool = pool
+        self.min_size = min_size
+        self.timeout = timeout
+        self.pending = None
+        self.submitted_at = 0.0
+        self.source = None
+
+    def __call__(self, gray):
+        now = time.monotonic()
+        if self.pending is not None and now - self.submitted_at > self.timeout:
+            # Worker died or fell far behind; try again
+            self.pending = None
+        if self.pending is None:
+            self.pending = self.pool.submit(gray, min_size=self.min_size)
+            self.submitted_at = now
+            if self.pending is not None:
+                if self.source is None or self.source.shape != gray.shape:
+                    self.source = np.empty_like(gray)
+                np.copyto(self.source, gray)
+            return None
+        boxes = self.pool.result(self.pending)
+        if boxes is not None:
+            self.pending = None
+        return boxes
@@ -0,0 +1,156 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class FrameSource:
+    # The subset of the cv2.VideoCapture interface the control scripts use,
+    # so recorded footage can stand in for the robot's camera.
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        raise NotImplementedError
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    # Live V4L2 camera
+    def __init__(self, index=0):
+        self.capture = cv2.VideoCapture(index, cv2.CAP_V4L2)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self, image=None):
+        if image is None:
+            return self.capture.read()
+        return self.capture.read(image)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def release(self):
+        self.capture.release()
+
+
+class Pacer:
+    # Spaces reads out to `fps` when realtime, otherwise returns immediately
+    def __init__(self, fps, realtime):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.realtime = realtime
+        self.next_time = None
+
+    def wait(self):
+        if not self.realtime or not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_time is None or now - self.next_time > self.interval:
+            # First frame, or we fell behind: don't try to catch up
+            self.next_time = now
+        elif self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += self.interval
+
+
+def _deliver(frame, image):
+    if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+        np.copyto(image, frame)
+        return True, image
+    return True, frame
+
+
+class VideoFileSource(FrameSource):
+    # Recorded clip, looped forever
+    def __init__(self, path, realtime=True, fps=None):
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        self.fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.pacer = Pacer(self.fps, realtime)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self, image=None):
+        self.pacer.wait()
+        ret, frame = self.capture.read()
+        if not ret:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+            if not ret:
+                return False, None
+        return _deliver(frame, image)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return self.capture.get(prop)
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirSource(FrameSource):
+    # Directory of still frames played back in name order, looped forever.
+    # Frames are decoded once and kept, so playback measures the pipeline
+    # rather than the disk.
+    def __init__(self, path, realtime=True, fps=30.0):
+        self.paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.frames = [None] * len(self.paths)
+        self.index = 0
+        self.fps = fps or 30.0
+        self.pacer = Pacer(self.fps, realtime)
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self, image=None):
+        if not self.paths:
+            return False, None
+        self.pacer.wait()
+        i = self.index
+        self.index = (self.index + 1) % len(self.paths)
+        if self.frames[i] is None:
+            self.frames[i] = cv2.imread(self.paths[i], cv2.IMREAD_COLOR)
+            if self.frames[i] is None:
+                return False, None
+        return _deliver(self.frames[i], image)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.paths)
+        return 0
+
+
+def open_source(spec=None, realtime=None, fps=None):
+    # spec is a camera index, a video file or an image directory. Defaults
+    # come from R2D2_FRAME_SOURCE (camera 0) and R2D2_PACING ('realtime' or
+    # 'fast'), so any control script can run against recorded footage.
+    if spec is None:
+        spec = os.environ.get('R2D2_FRAME_SOURCE', '0')
+    if realtime is None:
+        realtime = os.environ.get('R2D2_PACING', 'realtime') != 'fast'
+    spec = str(spec)
+    if spec.isdigit():
+        return CameraSource(int(spec))
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, realtime, fps)
+    return VideoFileSource(spec, realtime, fps)
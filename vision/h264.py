@@ -0,0 +1,265 @@
+import collections
+import threading
+from fractions import Fraction
+
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+# Fragmented MP4 with one moof/mdat pair per encoded frame, so a fragment
+# can be sent as soon as its frame is encoded
+MOVFLAGS = 'empty_moov+default_base_moof+frag_every_frame'
+
+
+class _Sink:
+    # Write-only file object for the MP4 muxer
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def split_boxes(data):
+    # Returns the complete top-level MP4 boxes at the start of data as
+    # (type, bytes) pairs, and how many bytes they used
+    boxes = []
+    offset = 0
+    while len(data) - offset >= 8:
+        size = int.from_bytes(data[offset:offset + 4], 'big')
+        header = 8
+        if size == 1:
+            if len(data) - offset < 16:
+                break
+            size = int.from_bytes(data[offset + 8:offset + 16], 'big')
+            header = 16
+        if size < header or len(data) - offset < size:
+            break
+        boxes.append((bytes(data[offset + 4:offset + 8]), bytes(data[offset:offset + size])))
+        offset += size
+    return boxes, offset
+
+
+def has_idr(mdat):
+    # mdat payload is length-prefixed (AVCC) H.264; NAL type 5 is an IDR slice
+    offset = 8
+    while offset + 5 <= len(mdat):
+        length = int.from_bytes(mdat[offset:offset + 4], 'big')
+        if mdat[offset + 4] & 0x1F == 5:
+            return True
+        offset += 4 + length
+    return False
+
+
+class H264Client:
+    # A client may only start, or resume after its queue overflowed, on a
+    # fragment that begins with a keyframe; dropping inter frames would
+    # corrupt the picture until the next one anyway.
+    def __init__(self, init_segment, queue_size):
+        self.init_segment = init_segment
+        self.fragments = collections.deque()
+        self.queue_size = queue_size
+        self.event = threading.Event()
+        self.needs_keyframe = True
+        self.closed = False
+        self.resyncs = 0
+
+    def put(self, fragment, keyframe):
+        if self.needs_keyframe and not keyframe:
+            return
+        if len(self.fragments) >= self.queue_size:
+            self.fragments.clear()
+            self.resyncs += 1
+            self.needs_keyframe = True
+            if not keyframe:
+                return
+        self.needs_keyframe = False
+        self.fragments.append(fragment)
+        self.event.set()
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
+
+class H264Broadcaster(threading.Thread):
+    # Opt-in H.264 stream. The MJPEG broadcaster hands it each rendered frame
+    # through push(); it encodes once with libx264 (ultrafast, zerolatency)
+    # and shares the fragmented MP4 output between all /video_h264 clients.
+    # Needs PyAV; `available` is False without it.
+    def __init__(self, bitrate=1000000, keyframe_interval=30, fps=30, queue_size=60):
+        super().__init__(daemon=True)
+        self.bitrate = bitrate
+        self.keyframe_interval = keyframe_interval
+        self.fps = fps
+        self.queue_size = queue_size
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        self.frame_lock = threading.Lock()
+        self.frame_event = threading.Event()
+        self.frame = None
+        self.frame_ts = 0.0
+        self.init_segment = b''
+        self.reconfigure = False
+        self.running = True
+        self.bytes_sent = 0
+
+    @property
+    def available(self):
+        return av is not None
+
+    @property
+    def active(self):
+        return bool(self.clients)
+
+    def push(self, seq, ts, frame):
+        if not self.clients:
+            return
+        with self.frame_lock:
+            if self.frame is None or self.frame.shape != frame.shape:
+                self.frame = np.empty_like(frame)
+            np.copyto(self.frame, frame)
+            self.frame_ts = ts
+        self.frame_event.set()
+
+    def configure(self, bitrate=None, keyframe_interval=None):
+        # Takes effect on a new encoder; connected clients are dropped and
+        # reconnect to pick up the new init segment
+        if bitrate:
+            self.bitrate = int(bitrate)
+        if keyframe_interval:
+            self.keyframe_interval = int(keyframe_interval)
+        self.reconfigure = True
+        self.frame_event.set()
+
+    def stats(self):
+        with self.clients_lock:
+            clients = len(self.clients)
+            resyncs = sum(c.resyncs for c in self.clients)
+        return {
+            'available': self.available,
+            'clients': clients,
+            'bitrate': self.bitrate,
+            'keyframe_interval': self.keyframe_interval,
+            'bytes_sent': self.bytes_sent,
+            'resyncs': resyncs,
+        }
+
+    def open_encoder(self, width, height):
+        sink = _Sink()
+        container = av.open(sink, mode='w', format='mp4', options={'movflags': MOVFLAGS})
+        stream = container.add_stream('libx264', rate=Fraction(self.fps).limit_denominator(1001))
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = 'yuv420p'
+        stream.bit_rate = self.bitrate
+        stream.codec_context.time_base = Fraction(1, 1000)
+        stream.options = {
+            'preset': 'ultrafast',
+            'tune': 'zerolatency',
+            'g': str(self.keyframe_interval),
+            'bf': '0',
+        }
+        return container, stream, sink
+
+    def run(self):
+        encoder = None
+        init_segment = b''
+        pending = bytearray()
+        fragment_head = b''
+        start_ts = None
+        last_pts = -1
+        while self.running:
+            if not self.frame_event.wait(1.0):
+                continue
+            self.frame_event.clear()
+            if self.reconfigure:
+                self.reconfigure = False
+                if encoder is not None:
+                    encoder[0].close()
+                    encoder = None
+                with self.clients_lock:
+                    for client in self.clients:
+                        client.close()
+                    self.clients.clear()
+                continue
+            with self.frame_lock:
+                if self.frame is None:
+                    continue
+                image = self.frame.copy()
+                ts = self.frame_ts
+            if encoder is None:
+                encoder = self.open_encoder(image.shape[1], image.shape[0])
+                init_segment = b''
+                pending = bytearray()
+                fragment_head = b''
+                start_ts = ts
+                last_pts = -1
+            container, stream, sink = encoder
+            video_frame = av.VideoFrame.from_ndarray(image, format='bgr24')
+            pts = max(int((ts - start_ts) * 1000), last_pts + 1)
+            last_pts = pts
+            video_frame.pts = pts
+            video_frame.time_base = Fraction(1, 1000)
+            for packet in stream.encode(video_frame):
+                container.mux(packet)
+            pending += sink.data
+            sink.data = bytearray()
+            boxes, used = split_boxes(pending)
+            del pending[:used]
+            for box_type, box in boxes:
+                if box_type in (b'ftyp', b'moov'):
+                    init_segment += box
+                    self.init_segment = init_segment
+                    with self.clients_lock:
+                        for client in self.clients:
+                            client.init_segment = init_segment
+                elif box_type == b'mdat':
+                    self.publish(fragment_head + box, has_idr(box))
+                    fragment_head = b''
+                else:
+                    fragment_head += box
+        if encoder is not None:
+            encoder[0].close()
+
+    def publish(self, fragment, keyframe):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.put(fragment, keyframe)
+
+    def stream(self):
+        client = H264Client(self.init_segment, self.queue_size)
+        with self.clients_lock:
+            self.clients.add(client)
+        sent_init = False
+        try:
+            while self.running and not client.closed:
+                if not client.event.wait(1.0):
+                    continue
+                client.event.clear()
+                if not client.fragments or not client.init_segment:
+                    continue
+                chunks = []
+                if not sent_init:
+                    chunks.append(client.init_segment)
+                    sent_init = True
+                while client.fragments:
+                    chunks.append(client.fragments.popleft())
+                data = b''.join(chunks)
+                self.bytes_sent += len(data)
+                yield data
+        finally:
+            with self.clients_lock:
+                self.clients.discard(client)
+
+    def stop(self):
+        self.running = False
+        self.frame_event.set()
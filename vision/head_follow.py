@@ -0,0 +1,95 @@
+import collections
+import threading
+import time
+
+from vision.tracing import tracer
+
+
+class HeadFollowController:
+    # Keeps a face centred by turning the head servo. The camera turns
+    # with the head, so each detection gives the remaining error: the
+    # horizontal offset of the largest face box from the image centre, in
+    # [-1, 1]. Offsets inside `deadband` are left alone, otherwise the
+    # angle moves by gain * offset degrees, limited to max_rate degrees per
+    # second and to [min_angle, max_angle]. Steps under min_step are
+    # skipped so the servo isn't commanded for nothing. direction flips the
+    # sign for a mirrored image.
+    #
+    # set_angle(angle) drives the servo; release() stops the pulses once
+    # the head has been still for release_after seconds, which stops servo
+    # jitter. The time from frame capture to servo command is recorded as
+    # the 'head_follow' tracer stage.
+    def __init__(self, set_angle, release=None, center=80, min_angle=20, max_angle=140,
+                 gain=25.0, deadband=0.08, max_rate=120.0, min_step=1.0, direction=1,
+                 release_after=0.5):
+        self.set_angle = set_angle
+        self.release = release
+        self.center = center
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.gain = gain
+        self.deadband = deadband
+        self.max_rate = max_rate
+        self.min_step = min_step
+        self.direction = direction
+        self.release_after = release_after
+        self.lock = threading.Lock()
+        self.angle = center
+        self.last_update = None
+        self.last_command = 0.0
+        self.released = True
+        self.offset = None
+        self.commands = collections.deque(maxlen=256)
+
+    def reset(self, angle=None):
+        with self.lock:
+            self.angle = self.center if angle is None else angle
+            self.last_update = None
+            self.offset = None
+
+    def update(self, boxes, frame_width, frame_time=None, seq=None, now=None):
+        # Called once per detection result; returns the commanded angle or None
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            dt = 0.1 if self.last_update is None else min(now - self.last_update, 0.2)
+            self.last_update = now
+            if not boxes:
+                self.offset = None
+                return self._idle(now)
+            x, _, w, _ = max(boxes, key=lambda b: b[2] * b[3])
+            half = frame_width / 2
+            self.offset = self.direction * (x + w / 2 - half) / half
+            if abs(self.offset) < self.deadband:
+                return self._idle(now)
+            step = self.gain * self.offset
+            limit = self.max_rate * dt
+            step = max(-limit, min(limit, step))
+            angle = max(self.min_angle, min(self.max_angle, self.angle + step))
+            if abs(angle - self.angle) < self.min_step:
+                return self._idle(now)
+            self.angle = angle
+            self.last_command = now
+            self.released = False
+            self.commands.append(now)
+        self.set_angle(angle)
+        if frame_time is not None:
+            tracer.record('head_follow', time.time() - frame_time, seq)
+        return angle
+
+    def _idle(self, now):
+        if not self.released and now - self.last_command > self.release_after:
+            self.released = True
+            if self.release:
+                self.release()
+        return None
+
+    def stats(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            recent = [t for t in self.commands if now - t <= 1.0]
+            return {
+                'angle': round(self.angle, 1),
+                'offset': None if self.offset is None else round(self.offset, 3),
+                'servo_updates_per_second': len(recent),
+                'latency': tracer.snapshot().get('head_follow'),
+            }
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    # Cheap motion detector that expensive stages subscribe to. Each frame
+    # is shrunk to `size` and compared with a running-average background;
+    # there is motion when more than area_threshold of the pixels differ
+    # by over pixel_threshold grey levels, and the gate stays open for
+    # `hold` seconds after the last motion. Several stages usually see the
+    # same frame, so update() only does the work once per seq.
+    def __init__(self, size=(80, 45), pixel_threshold=12, area_threshold=0.005, hold=1.0, alpha=0.2):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.hold = hold
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.thumb = np.empty(size[::-1], np.uint8)
+        self.thumb_f = np.empty(size[::-1], np.float32)
+        self.diff = np.empty(size[::-1], np.float32)
+        self.background = None
+        self.seq = None
+        self.changed = 0.0
+        self.last_motion = 0.0
+        self.moving = True
+        self.subscribers = []
+
+    def update(self, gray, seq=None, now=None):
+        # Returns whether the scene is moving as of this frame
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if seq is not None and seq == self.seq:
+                return self.moving
+            self.seq = seq
+            cv2.resize(gray, self.size, dst=self.thumb, interpolation=cv2.INTER_AREA)
+            np.copyto(self.thumb_f, self.thumb)
+            if self.background is None:
+                self.background = self.thumb_f.copy()
+                self.last_motion = now
+            else:
+                cv2.absdiff(self.thumb_f, self.background, dst=self.diff)
+                self.changed = np.count_nonzero(self.diff > self.pixel_threshold) / self.diff.size
+                cv2.accumulateWeighted(self.thumb_f, self.background, self.alpha)
+                if self.changed > self.area_threshold:
+                    self.last_motion = now
+            self.moving = now - self.last_motion < self.hold
+            return self.moving
+
+    def subscribe(self, name, heartbeat=2.0):
+        subscriber = MotionSubscriber(self, name, heartbeat)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def stats(self):
+        return {
+            'moving': self.moving,
+            'changed': round(self.changed, 4),
+            'stages': {s.name: s.stats() for s in self.subscribers},
+        }
+
+
+class MotionSubscriber:
+    # ready() is True on every frame while the scene moves, and otherwise
+    # once per `heartbeat` seconds so a stage still refreshes now and then
+    def __init__(self, gate, name, heartbeat):
+        self.gate = gate
+        self.name = name
+        self.heartbeat = heartbeat
+        self.last_run = 0.0
+        self.runs = 0
+        self.skipped = 0
+
+    def ready(self, gray, seq=None, now=None):
+        now = time.monotonic() if now is None else now
+        if self.gate.update(gray, seq, now) or now - self.last_run >= self.heartbeat:
+            self.last_run = now
+            self.runs += 1
+            return True
+        self.skipped += 1
+        return False
+
+    def stats(self):
+        return {'heartbeat': self.heartbeat, 'runs': self.runs, 'skipped': self.skipped}
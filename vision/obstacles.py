@@ -0,0 +1,97 @@
+import threading
+import time
+
+import numpy as np
+
+from vision.depth_backends import disp_to_depth
+
+
+class ObstacleSectors:
+    # Reduces each depth map to the distance of the nearest obstacle in a
+    # few steering sectors, left to right, for auto-braking.
+    #
+    # Only a horizontal band of the map is used (rows, as fractions of the
+    # displayed height) so the floor right in front of the robot doesn't
+    # count, and every second row and column is sampled. Per sector the
+    # `percentile` highest disparity is taken, i.e. a robust low percentile
+    # of depth that ignores a few noisy pixels, and just those values are
+    # converted with Monodepth2's disp_to_depth (min_depth/max_depth) times
+    # depth_scale. Monocular models are only right up to scale, so
+    # depth_scale and the stop/slow distances are tuned together on the
+    # robot. max_age covers the scheduler's idle refresh on a still scene.
+    # flipped=True means the camera is mounted upside down, as the
+    # stream's 180 degree flip assumes, so sectors and rows are mirrored.
+    def __init__(self, sectors=5, percentile=5.0, rows=(0.25, 0.75), min_depth=0.1,
+                 max_depth=100.0, depth_scale=1.0, stop_distance=0.5, slow_distance=1.5,
+                 max_age=3.0, flipped=True):
+        self.sectors = sectors
+        self.percentile = percentile
+        self.rows = rows
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.depth_scale = depth_scale
+        self.stop_distance = stop_distance
+        self.slow_distance = slow_distance
+        self.max_age = max_age
+        self.flipped = flipped
+        self.lock = threading.Lock()
+        self.distances = None
+        self.timestamp = 0.0
+        self.updates = 0
+
+    def reduce(self, disp):
+        if disp.ndim == 3:
+            disp = disp[:, :, 0]
+        h, w = disp.shape
+        r0, r1 = int(h * self.rows[0]), int(h * self.rows[1])
+        if self.flipped:
+            r0, r1 = h - r1, h - r0
+        band = disp[r0:r1:2, ::2]
+        k = band.shape[1] // self.sectors
+        band = band[:, :k * self.sectors].reshape(band.shape[0], self.sectors, k)
+        samples = band.transpose(1, 0, 2).reshape(self.sectors, -1)
+        # Highest disparities are the nearest pixels
+        kth = int(samples.shape[1] * (1 - self.percentile / 100.0))
+        kth = min(max(kth, 0), samples.shape[1] - 1)
+        near = np.partition(samples, kth, axis=1)[:, kth]
+        depth = self.depth_scale * disp_to_depth(near, self.min_depth, self.max_depth)
+        if self.flipped:
+            depth = depth[::-1]
+        return tuple(float(d) for d in depth)
+
+    def update(self, disp, now=None):
+        distances = self.reduce(disp)
+        with self.lock:
+            self.distances = distances
+            self.timestamp = time.monotonic() if now is None else now
+            self.updates += 1
+        return distances
+
+    def latest(self, now=None):
+        # Distances left to right, or None once they are older than max_age
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.distances is None or now - self.timestamp > self.max_age:
+                return None
+            return self.distances
+
+    def throttle_scale(self, steering, now=None):
+        # Factor in [0, 1] for forward throttle: 1 beyond slow_distance,
+        # 0 at stop_distance, judged on the sector(s) the steering points at.
+        # Without a fresh depth map there is nothing to brake on.
+        distances = self.latest(now)
+        if distances is None:
+            return 1.0
+        centre = (max(-1.0, min(1.0, steering)) + 1) / 2 * (self.sectors - 1)
+        lo, hi = int(np.floor(centre)), int(np.ceil(centre))
+        nearest = min(distances[lo], distances[hi])
+        span = self.slow_distance - self.stop_distance
+        return max(0.0, min(1.0, (nearest - self.stop_distance) / span))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'distances': None if self.distances is None else [round(d, 2) for d in self.distances],
+                'age': round(time.monotonic() - self.timestamp, 2) if self.distances else None,
+                'updates': self.updates,
+            }
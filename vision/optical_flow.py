@@ -0,0 +1,107 @@
+import cv2
+import numpy as np
+
+FEATURE_PARAMS = dict(qualityLevel=0.3, minDistance=7, blockSize=7)
+FLOW_LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                      criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class OpticalFlowTracker:
+    # Sparse Lucas-Kanade tracks kept in one persistent (N, 1, 2) array
+    # with a stable id per track. Lost tracks are dropped in place; when
+    # fewer than refill_below * max_tracks remain, new corners are found
+    # only in grid cells that hold no track (goodFeaturesToTrack with a
+    # cell mask), so surviving tracks are never thrown away and a refill
+    # costs the same however many tracks were lost.
+    #
+    # draw() renders every track's motion this frame as one polylines call
+    # for the segments and one for the dots (degenerate segments with round
+    # caps) per palette colour; a track's colour comes from its id.
+    def __init__(self, max_tracks=100, grid=(8, 6), refill_below=0.8, palette_size=8,
+                 feature_params=FEATURE_PARAMS, lk_params=FLOW_LK_PARAMS):
+        self.max_tracks = max_tracks
+        self.grid = grid
+        self.refill_below = refill_below
+        self.feature_params = feature_params
+        self.lk_params = lk_params
+        self.palette = [tuple(int(c) for c in color)
+                        for color in np.random.randint(0, 255, (palette_size, 3))]
+        self.prev = None
+        self.buffers = None
+        self.mask = None
+        self.next_id = 0
+        self.refills = 0
+        self.reset()
+
+    def reset(self):
+        self.points = np.empty((0, 1, 2), np.float32)
+        self.ids = np.empty(0, np.int64)
+        self.old = self.points
+        self.prev = None
+        self.moved = 0
+
+    def update(self, gray):
+        # Tracks into `gray` and tops up; returns the (N, 1, 2) track array
+        moved = 0
+        if self.prev is not None and len(self.points):
+            nxt, status, _ = cv2.calcOpticalFlowPyrLK(self.prev, gray, self.points, None,
+                                                      **self.lk_params)
+            good = status.ravel() == 1
+            self.old = self.points[good]
+            self.points = nxt[good]
+            self.ids = self.ids[good]
+            moved = len(self.points)
+        else:
+            self.old = self.points[:0]
+        self.moved = moved
+        if len(self.points) < self.max_tracks * self.refill_below:
+            self._top_up(gray)
+        # Keep our own copy of the frame; the caller may reuse its buffer
+        if self.buffers is None or self.buffers[0].shape != gray.shape:
+            self.buffers = [np.empty_like(gray), np.empty_like(gray)]
+        self.buffers.reverse()
+        np.copyto(self.buffers[0], gray)
+        self.prev = self.buffers[0]
+        return self.points
+
+    def _top_up(self, gray):
+        h, w = gray.shape[:2]
+        gx, gy = self.grid
+        free = np.ones((gy, gx), np.uint8)
+        if len(self.points):
+            xy = self.points.reshape(-1, 2)
+            cols = np.clip((xy[:, 0] * gx / w).astype(np.int32), 0, gx - 1)
+            rows = np.clip((xy[:, 1] * gy / h).astype(np.int32), 0, gy - 1)
+            free[rows, cols] = 0
+        if not free.any():
+            return
+        if self.mask is None or self.mask.shape != (h, w):
+            self.mask = np.empty((h, w), np.uint8)
+        cv2.resize(free * 255, (w, h), dst=self.mask, interpolation=cv2.INTER_NEAREST)
+        found = cv2.goodFeaturesToTrack(gray, maxCorners=self.max_tracks - len(self.points),
+                                        mask=self.mask, **self.feature_params)
+        self.refills += 1
+        if found is None:
+            return
+        ids = np.arange(self.next_id, self.next_id + len(found))
+        self.next_id += len(found)
+        self.points = np.concatenate([self.points, found.astype(np.float32)])
+        self.ids = np.concatenate([self.ids, ids])
+
+    def draw(self, frame, line_thickness=2, dot_radius=5):
+        if not self.moved:
+            return frame
+        new = self.points[:self.moved].astype(np.int32)
+        segments = np.concatenate([new, self.old.astype(np.int32)], axis=1)
+        dots = np.concatenate([new, new], axis=1)
+        slots = self.ids[:self.moved] % len(self.palette)
+        for slot, color in enumerate(self.palette):
+            picked = slots == slot
+            if not picked.any():
+                continue
+            cv2.polylines(frame, list(segments[picked]), False, color, line_thickness)
+            cv2.polylines(frame, list(dots[picked]), False, color, dot_radius * 2)
+        return frame
+
+    def stats(self):
+        return {'tracks': len(self.points), 'moved': self.moved, 'refills': self.refills}
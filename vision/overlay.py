@@ -0,0 +1,102 @@
+import cv2
+import numpy as np
+
+from vision.tracing import tracer
+
+
+def _merge(regions):
+    # Merges overlapping (x0, y0, x1, y1) rectangles so no pixel is blended twice
+    merged = []
+    for r in regions:
+        r = list(r)
+        i = 0
+        while i < len(merged):
+            m = merged[i]
+            if r[0] < m[2] and m[0] < r[2] and r[1] < m[3] and m[1] < r[3]:
+                r = [min(r[0], m[0]), min(r[1], m[1]), max(r[2], m[2]), max(r[3], m[3])]
+                merged.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged.append(r)
+    return merged
+
+
+class OverlayCompositor:
+    # Collects a frame's overlays and applies them in one pass. Translucent
+    # boxes are painted into a preallocated colour layer and per-pixel alpha
+    # mask (the later tint wins where boxes overlap), then blended with
+    # cv2.blendLinear over just the regions they cover; no full-frame
+    # copies. A full-frame layer (the depth map) is a single in-place
+    # addWeighted. Opaque outlines and markers go on last.
+    #
+    #   compositor.begin(frame)
+    #   compositor.tint(box, color, 0.15)
+    #   compositor.rectangle(box, color, 4)
+    #   compositor.compose()
+    def __init__(self):
+        self.layer = None
+        self.alpha = None
+        self.inv_alpha = None
+        self.frame = None
+        self.regions = []
+        self.opaque = []
+        self.full = None
+
+    def begin(self, frame):
+        if self.layer is None or self.layer.shape != frame.shape:
+            self.layer = np.zeros(frame.shape, np.uint8)
+            self.alpha = np.zeros(frame.shape[:2], np.float32)
+            self.inv_alpha = np.zeros(frame.shape[:2], np.float32)
+        self.frame = frame
+        self.regions = []
+        self.opaque = []
+        self.full = None
+
+    def _clip(self, box):
+        x, y, w, h = box
+        height, width = self.frame.shape[:2]
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(width, int(x + w)), min(height, int(y + h))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
+
+    def tint(self, box, color, alpha):
+        r = self._clip(box)
+        if r is None:
+            return
+        x0, y0, x1, y1 = r
+        self.layer[y0:y1, x0:x1] = color
+        self.alpha[y0:y1, x0:x1] = alpha
+        self.regions.append(r)
+
+    def image(self, image, alpha):
+        # Full-frame layer, e.g. the colourised depth map at frame size
+        self.full = (image, alpha)
+
+    def rectangle(self, box, color, thickness):
+        x, y, w, h = box
+        self.opaque.append((cv2.rectangle, ((x, y), (x + w, y + h), color, thickness)))
+
+    def marker(self, point, color, marker_type=cv2.MARKER_CROSS, size=10, thickness=2):
+        self.opaque.append((cv2.drawMarker, (point, color, marker_type, size, thickness)))
+
+    def compose(self):
+        frame = self.frame
+        with tracer.stage('composite'):
+            if self.full is not None:
+                image, alpha = self.full
+                cv2.addWeighted(frame, 1 - alpha, image, alpha, 0, dst=frame)
+            for x0, y0, x1, y1 in _merge(self.regions):
+                roi = frame[y0:y1, x0:x1]
+                alpha = self.alpha[y0:y1, x0:x1]
+                inv = self.inv_alpha[y0:y1, x0:x1]
+                np.subtract(1.0, alpha, out=inv)
+                cv2.blendLinear(self.layer[y0:y1, x0:x1], roi, alpha, inv, dst=roi)
+                # Leave the mask clear for the next frame
+                alpha[:] = 0
+            for draw, args in self.opaque:
+                draw(frame, *args)
+        self.frame = None
+        return frame
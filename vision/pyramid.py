@@ -0,0 +1,81 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from vision.tracing import tracer
+
+
+class FramePyramid(threading.Thread):
+    # Resizes each captured frame once into every resolution the vision
+    # consumers need, e.g. {'detect': (320, 180, 'gray'), 'depth': (640, 192, 'bgr')}.
+    # Output goes into a ring of preallocated buffers. A published level is
+    # valid for ring_size - 1 further frames, so a consumer that holds one
+    # longer than that should np.copyto() it into a buffer it owns.
+    def __init__(self, capture, levels, ring_size=4):
+        super().__init__(daemon=True)
+        self.capture = capture
+        self.levels = levels
+        self.ring_size = ring_size
+        self.ring = None
+        self.scratch = {}
+        self.slot = 0
+        self.cond = threading.Condition()
+        self.published = {}
+        self.source_shape = None
+        self.seq = 0
+        self.timestamp = 0.0
+        self.running = True
+
+    def _allocate(self):
+        self.ring = []
+        for _ in range(self.ring_size):
+            slot = {}
+            for name, (w, h, color) in self.levels.items():
+                channels = () if color == 'gray' else (3,)
+                slot[name] = np.empty((h, w) + channels, np.uint8)
+            self.ring.append(slot)
+        for name, (w, h, color) in self.levels.items():
+            if color == 'gray':
+                self.scratch[name] = np.empty((h, w, 3), np.uint8)
+
+    def run(self):
+        last_seq = 0
+        while self.running:
+            seq, ts, frame = self.capture.wait_next(last_seq)
+            if seq == last_seq:
+                continue
+            last_seq = seq
+            if frame is None:
+                continue
+            if self.ring is None:
+                self._allocate()
+            start = time.perf_counter()
+            slot = self.ring[self.slot]
+            self.slot = (self.slot + 1) % self.ring_size
+            for name, (w, h, color) in self.levels.items():
+                if color == 'gray':
+                    cv2.resize(frame, (w, h), dst=self.scratch[name], interpolation=cv2.INTER_AREA)
+                    cv2.cvtColor(self.scratch[name], cv2.COLOR_BGR2GRAY, dst=slot[name])
+                else:
+                    cv2.resize(frame, (w, h), dst=slot[name], interpolation=cv2.INTER_AREA)
+            tracer.record('pyramid', time.perf_counter() - start, seq)
+            with self.cond:
+                self.published = slot
+                self.source_shape = frame.shape
+                self.seq = seq
+                self.timestamp = ts
+                self.cond.notify_all()
+
+    def wait_next(self, last_seq, timeout=1.0):
+        # Returns (seq, timestamp, levels, source_shape); levels is empty
+        # until the first decoded frame arrives
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != last_seq or not self.running, timeout)
+            return self.seq, self.timestamp, self.published, self.source_shape
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import deque
+
+from vision.tracing import tracer
+
+# Seconds of start times kept for achieved_rate
+RATE_WINDOW = 5.0
+
+
+class VisionTask:
+    # One scheduled workload. ready() says whether the task may run on
+    # this frame, given the rate the scheduler currently allows it;
+    # running() times the work, which becomes the measured cost. A task
+    # that paces itself (the depth scheduler) reads `available`, the CPU
+    # left at its priority, and calls mark() when it runs instead.
+    def __init__(self, scheduler, name, priority, rate, cost, min_rate):
+        self.scheduler = scheduler
+        self.name = name
+        self.priority = priority
+        self.rate = rate
+        self.declared_cost = cost
+        self.cost = None
+        self.min_rate = min_rate
+        self.allowed_rate = rate
+        self.share = rate * cost if cost else 0.0
+        self.available = scheduler.cpu_budget
+        self.last_start = 0.0
+        self.starts = deque()
+        self.skipped = 0
+
+    def ready(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.scheduler.rebalance(now)
+        # A little slack so a rate that divides the frame rate isn't missed by jitter
+        if now - self.last_start < 0.95 / self.allowed_rate:
+            self.skipped += 1
+            return False
+        self.mark(now)
+        return True
+
+    def mark(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.last_start = now
+        self.starts.append(now)
+        while now - self.starts[0] > RATE_WINDOW:
+            self.starts.popleft()
+
+    def record(self, seconds):
+        self.cost = seconds if self.cost is None else 0.8 * self.cost + 0.2 * seconds
+
+    def running(self):
+        return _Timed(self)
+
+    def achieved_rate(self, now=None, window=RATE_WINDOW):
+        # Read-only: mark() runs on the task's thread and does the trimming
+        now = time.monotonic() if now is None else now
+        return sum(1 for t in list(self.starts) if now - t <= window) / window
+
+    def stats(self):
+        cost = self.cost if self.cost is not None else self.declared_cost
+        return {
+            'priority': self.priority,
+            'target_rate': self.rate,
+            'allowed_rate': round(self.allowed_rate, 2),
+            'achieved_rate': round(self.achieved_rate(), 2),
+            'cost_ms': None if cost is None else round(cost * 1000, 2),
+            'cpu_share': round(self.share, 3),
+            'skipped': self.skipped,
+        }
+
+
+class _Timed:
+    def __init__(self, task):
+        self.task = task
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.task.record(time.perf_counter() - self.start)
+        return False
+
+
+class VisionScheduler:
+    # Shares a CPU budget (in cores) between vision tasks. Reserved work,
+    # the motor control loop and the video stream, is never held back: its
+    # measured use (from tracer stages, rate x median time) comes off the
+    # budget first. What is left goes to the tasks in priority order (0
+    # first), each getting up to target rate x cost, where cost is the
+    # measured time per run, or the declared one until there is a
+    # measurement. A task's allowed rate is its share over its cost, never
+    # below min_rate, so a starved task still refreshes now and then.
+    def __init__(self, cpu_budget=1.5, interval=0.5):
+        self.cpu_budget = cpu_budget
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.tasks = []
+        self.reserved = {}
+        self.reserved_use = {}
+        self.last_rebalance = 0.0
+
+    def reserve(self, name, stages):
+        # Work that always runs; its cost is read from these tracer stages
+        self.reserved[name] = stages
+
+    def register(self, name, priority, rate, cost=None, min_rate=0.5):
+        task = VisionTask(self, name, priority, rate, cost, min_rate)
+        with self.lock:
+            self.tasks.append(task)
+            self.tasks.sort(key=lambda t: t.priority)
+        return task
+
+    def rebalance(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if now - self.last_rebalance < self.interval:
+                return
+            self.last_rebalance = now
+            stages = tracer.snapshot()
+            remaining = self.cpu_budget
+            for name, names in self.reserved.items():
+                use = sum(stages[s]['fps'] * stages[s]['p50_ms'] / 1000
+                          for s in names if s in stages)
+                self.reserved_use[name] = use
+                remaining -= use
+            for task in self.tasks:
+                task.available = max(0.0, remaining)
+                cost = task.cost if task.cost is not None else task.declared_cost
+                if not cost:
+                    task.allowed_rate = task.rate
+                    continue
+                share = max(0.0, min(task.rate * cost, remaining))
+                task.allowed_rate = max(task.min_rate, min(task.rate, share / cost))
+                task.share = task.allowed_rate * cost
+                remaining -= task.share
+
+    def stats(self):
+        self.rebalance()
+        with self.lock:
+            used = sum(self.reserved_use.values()) + sum(t.share for t in self.tasks)
+            return {
+                'cpu_budget': self.cpu_budget,
+                'cpu_planned': round(used, 3),
+                'reserved': {name: round(use, 3) for name, use in self.reserved_use.items()},
+                'tasks': {t.name: t.stats() for t in self.tasks},
+            }
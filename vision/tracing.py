@@ -0,0 +1,90 @@
+import collections
+import contextlib
+import threading
+import time
+
+
+class StageStats:
+    def __init__(self, window):
+        self.durations = collections.deque(maxlen=window)
+        self.ends = collections.deque(maxlen=window)
+        self.count = 0
+        self.last_seq = None
+
+
+class Tracer:
+    # Rolling per-stage latency and rate for the frame pipeline. Recording is
+    # two deque appends under a lock; percentiles are only computed when the
+    # stats are read, so this is cheap enough to leave on.
+    def __init__(self, window=512):
+        self.window = window
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds, seq=None):
+        now = time.monotonic()
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats(self.window)
+            stats.durations.append(seconds)
+            stats.ends.append(now)
+            stats.count += 1
+            if seq is not None:
+                stats.last_seq = seq
+
+    @contextlib.contextmanager
+    def stage(self, name, seq=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, seq)
+
+    def snapshot(self):
+        with self.lock:
+            stages = {name: (sorted(s.durations), list(s.ends), s.count, s.last_seq)
+                      for name, s in self.stages.items()}
+        now = time.monotonic()
+        result = {}
+        for name, (durations, ends, count, last_seq) in stages.items():
+            if not durations:
+                continue
+            # Rate over the samples still in the window, unless they are stale
+            span = now - ends[0]
+            fps = (len(ends) - 1) / span if len(ends) > 1 and span > 0 else 0.0
+            result[name] = {
+                'count': count,
+                'last_seq': last_seq,
+                'fps': round(fps, 2),
+                'p50_ms': round(_percentile(durations, 0.50) * 1000, 2),
+                'p95_ms': round(_percentile(durations, 0.95) * 1000, 2),
+                'p99_ms': round(_percentile(durations, 0.99) * 1000, 2),
+            }
+        return result
+
+    def prometheus(self):
+        lines = [
+            '# HELP r2d2_stage_latency_seconds Per-stage frame pipeline latency',
+            '# TYPE r2d2_stage_latency_seconds summary',
+        ]
+        snapshot = self.snapshot()
+        for name, s in snapshot.items():
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                lines.append('r2d2_stage_latency_seconds{stage="%s",quantile="%s"} %g'
+                             % (name, quantile, s[key] / 1000))
+            lines.append('r2d2_stage_latency_seconds_count{stage="%s"} %d' % (name, s['count']))
+        lines.append('# HELP r2d2_stage_fps Frames per second through each stage')
+        lines.append('# TYPE r2d2_stage_fps gauge')
+        for name, s in snapshot.items():
+            lines.append('r2d2_stage_fps{stage="%s"} %g' % (name, s['fps']))
+        return '\n'.join(lines) + '\n'
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+# Shared by every stage of the pipeline
+tracer = Tracer()
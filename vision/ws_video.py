@@ -0,0 +1,78 @@
+import json
+import struct
+import time
+
+from vision.tracing import tracer
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+# Binary message: little-endian uint32 sequence number, float64 capture
+# time (server time.time()), then the JPEG bytes
+FRAME_HEADER = struct.Struct('<Id')
+
+
+def stream_websocket(broadcaster, ws, max_in_flight=2, ack_timeout=2.0):
+    # Sends the newest frame only when the client has acknowledged enough of
+    # the previous ones ({"ack": seq} text messages). Frames produced while
+    # the client is busy are skipped, never queued. A frame not acknowledged
+    # within ack_timeout is given up on, so one lost ack can't stall the
+    # stream; it counts as a drop for the quality controller.
+    client = broadcaster.subscribe(queue_size=1)
+    sent = {}
+    try:
+        while broadcaster.running:
+            timeout = 1.0 if len(sent) >= max_in_flight else 0
+            message = ws.receive(timeout=timeout)
+            while message is not None:
+                _handle_ack(client, sent, message)
+                message = ws.receive(timeout=0)
+            now = time.time()
+            expired = [s for s, entry in sent.items() if now - entry[2] > ack_timeout]
+            for seq in expired:
+                del sent[seq]
+                client.controller.observe(ack_timeout, True)
+            if len(sent) >= max_in_flight:
+                continue
+            item = client.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, ts, jpeg = item
+            with tracer.stage('send', seq):
+                ws.send(FRAME_HEADER.pack(seq & 0xFFFFFFFF, ts) + jpeg)
+            sent[seq & 0xFFFFFFFF] = (ts, client.dropped, time.time())
+    finally:
+        broadcaster.unsubscribe(client)
+
+
+def _handle_ack(client, sent, message):
+    try:
+        seq = int(json.loads(message)['ack'])
+    except (ValueError, KeyError, TypeError):
+        return
+    entry = sent.pop(seq, None)
+    if entry is None:
+        return
+    ts, dropped, _ = entry
+    # Anything older than the acknowledged frame is never coming back
+    for old in [s for s in sent if s < seq]:
+        del sent[old]
+    age = time.time() - ts
+    tracer.record('frame_age', age, seq)
+    client.controller.observe(age, client.dropped != dropped)
+
+
+def attach(app, broadcaster, route='/video_ws', max_in_flight=2):
+    # Registers the WebSocket video channel; returns False when flask-sock
+    # is not installed and only /video_feed is available
+    if Sock is None:
+        return False
+    sock = Sock(app)
+
+    @sock.route(route)
+    def video_ws(ws):
+        stream_websocket(broadcaster, ws, max_in_flight)
+
+    return True